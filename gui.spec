@@ -7,8 +7,15 @@ a = Analysis(
     [".\\libs\\gui\\main.py"],
     pathex=[".\\gui"],
     binaries=[],
-    datas=[],
-    hiddenimports=["libs.parsers", "libs.parsers.*"],
+    datas=[(".\\libs\\rate_tables", "libs\\rate_tables")],
+    hiddenimports=[
+        "libs.parsers",
+        "libs.parsers.*",
+        "libs.parsers.revolut",
+        "libs.parsers.trading212",
+        "libs.parsers.passfolio",
+        "libs.parsers.csv",
+    ],
     hookspath=[],
     runtime_hooks=[],
     excludes=[],
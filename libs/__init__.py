@@ -3,6 +3,13 @@ BNB_BASE_URL = "https://www.bnb.bg/Statistics/StExternalSector/StExchangeRates/S
 BNB_DATE_FORMAT = "%d.%m.%Y"
 BNB_SPLIT_BY_MONTHS = 3
 BNB_CSV_HEADER_ROWS = 2
+BNB_CURRENCY = "USD"
+BNB_CONCURRENCY = 4
+BNB_RETRIES = 3
+BNB_RETRY_BACKOFF = 1
+BNB_TIMEOUT = 30
+
+FIXED_EXCHANGE_RATES = {"BGN": "1", "EUR": "1.95583"}
 
 NAP_DIGIT_PRECISION = "0.01"
 NAP_DATE_FORMAT = "%Y-%m-%d"
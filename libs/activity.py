@@ -0,0 +1,65 @@
+ACTIVITY_FIELDS = ["trade_date", "settle_date", "currency", "activity_type", "symbol", "company", "symbol_description", "quantity", "price", "amount"]
+EXCHANGE_RATE_FIELDS = ["exchange_rate_date", "exchange_rate"]
+
+
+class Activity(object):
+    __slots__ = ACTIVITY_FIELDS + EXCHANGE_RATE_FIELDS
+
+    def __init__(self, trade_date, settle_date, currency, activity_type, symbol, company, symbol_description, quantity, price, amount):
+        self.trade_date = trade_date
+        self.settle_date = settle_date
+        self.currency = currency
+        self.activity_type = activity_type
+        self.symbol = symbol
+        self.company = company
+        self.symbol_description = symbol_description
+        self.quantity = quantity
+        self.price = price
+        self.amount = amount
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__ and hasattr(self, key)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __eq__(self, other):
+        if not isinstance(other, Activity):
+            return NotImplemented
+
+        return self.items() == other.items()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Activity({dict(self.items())})"
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [key for key in self.__slots__ if hasattr(self, key)]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.__slots__ if hasattr(self, key)]
+
+    def to_tuple(self):
+        return tuple(getattr(self, field) for field in ACTIVITY_FIELDS)
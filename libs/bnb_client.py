@@ -0,0 +1,139 @@
+import io
+import csv
+import http.client
+import logging
+import queue
+import threading
+import time
+import decimal
+from datetime import datetime
+from urllib.parse import urlencode, urlsplit
+
+logger = logging.getLogger("exchange_rates")
+
+decimal.getcontext().rounding = decimal.ROUND_HALF_UP
+
+from libs import BNB_BASE_URL, BNB_DATE_FORMAT, BNB_CSV_HEADER_ROWS, BNB_CURRENCY, BNB_TIMEOUT
+
+
+class CountingReader(io.RawIOBase):
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = self.stream.readinto(buffer)
+        self.bytes_read += size
+        return size
+
+
+def read_exchange_rates(reader, currency=None):
+    for index, row in enumerate(reader):
+        if index < BNB_CSV_HEADER_ROWS:
+            continue
+
+        if not row:
+            continue
+
+        if currency is not None and row[2].strip() != currency:
+            continue
+
+        yield datetime.strptime(row[0], BNB_DATE_FORMAT), decimal.Decimal(row[3].strip())
+
+
+def get_request_params(first_date, last_date, currency):
+    params = {
+        "downloadOper": "true",
+        "group1": "second",
+        "valutes": currency,
+        "search": "true",
+        "showChart": "false",
+        "showChartButton": "false",
+        "type": "CSV",
+    }
+
+    params["periodStartDays"] = "{:02d}".format(first_date.day)
+    params["periodStartMonths"] = "{:02d}".format(first_date.month)
+    params["periodStartYear"] = first_date.year
+
+    params["periodEndDays"] = "{:02d}".format(last_date.day)
+    params["periodEndMonths"] = "{:02d}".format(last_date.month)
+    params["periodEndYear"] = last_date.year
+
+    return params
+
+
+class BNBClient(object):
+    def __init__(self, base_url=BNB_BASE_URL, timeout=BNB_TIMEOUT):
+        url = urlsplit(base_url)
+        self.connection_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        self.host = url.netloc
+        self.path = url.path or "/"
+        self.timeout = timeout
+
+        self.connections = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_read = 0
+        self.latency = 0
+
+    def acquire_connection(self):
+        try:
+            return self.connections.get_nowait()
+        except queue.Empty:
+            return self.connection_class(self.host, timeout=self.timeout)
+
+    def release_connection(self, connection):
+        self.connections.put(connection)
+
+    def request_exchange_rates(self, first_date, last_date, currency=BNB_CURRENCY):
+        logger.debug(f"Obtaining [{currency}] exchange rate from date range: [{first_date}] - [{last_date}]")
+
+        connection = self.acquire_connection()
+        start_time = time.perf_counter()
+        try:
+            connection.request("GET", f"{self.path}?{urlencode(get_request_params(first_date, last_date, currency))}")
+            response = connection.getresponse()
+
+            stream = CountingReader(response)
+            if response.status != http.client.OK:
+                response.read()
+                raise http.client.HTTPException(f"BNB online service responded with status [{response.status} {response.reason}].")
+
+            text_stream = io.TextIOWrapper(io.BufferedReader(stream), encoding="utf-8", newline="")
+            exchange_rates = dict(read_exchange_rates(csv.reader(text_stream, delimiter=","), currency))
+        except Exception:
+            connection.close()
+            raise
+
+        self.release_connection(connection)
+
+        latency = time.perf_counter() - start_time
+        with self.lock:
+            self.requests += 1
+            self.bytes_read += stream.bytes_read
+            self.latency += latency
+
+        logger.debug(
+            f"Obtained [{currency}] exchange rate from date range: [{first_date}] - [{last_date}] in {latency:.3f}s, {stream.bytes_read} bytes."
+        )
+        return exchange_rates
+
+    def close(self):
+        while not self.connections.empty():
+            self.connections.get_nowait().close()
+
+
+bnb_clients = {}
+bnb_clients_lock = threading.Lock()
+
+
+def get_bnb_client(base_url=BNB_BASE_URL):
+    with bnb_clients_lock:
+        if base_url not in bnb_clients:
+            bnb_clients[base_url] = BNBClient(base_url)
+
+        return bnb_clients[base_url]
@@ -8,7 +8,7 @@ import decimal
 decimal.getcontext().rounding = decimal.ROUND_HALF_UP
 
 
-def export_to_csv(list_object, csv_file, fieldnames):
+def export_to_csv(list_object, csv_file, fieldnames, extrasaction="raise"):
 
     csv_list_object = humanize_date(list_object)
 
@@ -18,6 +18,7 @@ def export_to_csv(list_object, csv_file, fieldnames):
             fieldnames=fieldnames,
             quotechar='"',
             quoting=csv.QUOTE_ALL,
+            extrasaction=extrasaction,
         )
 
         header = {fieldname: fieldname.replace("_", " ").title() for fieldname in fieldnames}
@@ -42,6 +43,7 @@ def export_statements(file_path, statements):
             "price",
             "amount",
         ],
+        extrasaction="ignore",
     )
 
 
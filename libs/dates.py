@@ -0,0 +1,94 @@
+import re
+from datetime import datetime
+from functools import lru_cache
+
+DATE_CACHE_SIZE = 4096
+
+# Zero-padded directives supported by the slicing parsers: width and position in the datetime constructor
+DATE_DIRECTIVES = {"Y": (4, 0), "m": (2, 1), "d": (2, 2), "H": (2, 3), "M": (2, 4), "S": (2, 5)}
+DATE_FORMAT_TOKEN = re.compile(r"%(.)|([^%]+)")
+# datetime.fromisoformat of Python < 3.11 accepts only 3 or 6 fraction digits and +HH:MM offsets
+ISO_DATE_TIME = re.compile(r"([0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9]{2}:[0-9]{2}:[0-9]{2})(?:\.([0-9]{1,6}))?(?:(Z)|([+-][0-9]{2}):?([0-9]{2}))?")
+
+
+def compile_date_format(date_format):
+    pattern = ""
+    groups = [None] * 6
+    group_count = 0
+    for match in DATE_FORMAT_TOKEN.finditer(date_format):
+        directive, literal = match.groups()
+        if literal is not None:
+            pattern += re.escape(literal)
+            continue
+
+        if directive not in DATE_DIRECTIVES or groups[DATE_DIRECTIVES[directive][1]] is not None:
+            return None
+
+        width, field_index = DATE_DIRECTIVES[directive]
+        group_count += 1
+        groups[field_index] = group_count
+        pattern += f"([0-9]{{{width}}})"
+
+    groups = groups[: groups.index(None)] if None in groups else groups
+    if len(groups) < 3 or group_count != len(groups):
+        return None
+
+    return re.compile(pattern).fullmatch, tuple(groups)
+
+
+def get_slicing_parser(date_format):
+    compiled_date_format = compile_date_format(date_format)
+    if compiled_date_format is None:
+        return None
+
+    match_date, groups = compiled_date_format
+
+    def parse(date_string):
+        match = match_date(date_string)
+        if match is None:
+            return datetime.strptime(date_string, date_format)
+
+        return datetime(*map(int, match.group(*groups)))
+
+    return parse
+
+
+@lru_cache(maxsize=None)
+def get_date_parser(date_format):
+    parse = get_slicing_parser(date_format)
+    if parse is None:
+        parse = lambda date_string: datetime.strptime(date_string, date_format)
+
+    return lru_cache(maxsize=DATE_CACHE_SIZE)(parse)
+
+
+def to_iso_format(date_string):
+    match = ISO_DATE_TIME.fullmatch(date_string)
+    if match is None:
+        return None
+
+    date_time, fraction, utc, offset_hours, offset_minutes = match.groups()
+    iso_date_string = date_time
+    if fraction is not None:
+        iso_date_string += "." + fraction.ljust(6, "0")
+
+    if utc is not None:
+        iso_date_string += "+00:00"
+    elif offset_hours is not None:
+        iso_date_string += f"{offset_hours}:{offset_minutes}"
+
+    return iso_date_string
+
+
+@lru_cache(maxsize=None)
+def get_iso_date_parser(date_format, naive=False):
+    def parse(date_string):
+        iso_date_string = to_iso_format(date_string)
+        if iso_date_string is None:
+            date = datetime.strptime(date_string, date_format)
+        else:
+            date = datetime.fromisoformat(iso_date_string)
+
+        return date.replace(tzinfo=None) if naive else date
+
+    return lru_cache(maxsize=DATE_CACHE_SIZE)(parse)
@@ -1,104 +1,393 @@
-from io import StringIO
-import csv
 from dateutil.relativedelta import relativedelta
-import urllib.request
-from urllib.parse import urlencode
 from datetime import datetime, timedelta
 import json
 import os
 import decimal
 import logging
+import time
+from bisect import bisect_right
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger("exchange_rates")
 
 decimal.getcontext().rounding = decimal.ROUND_HALF_UP
 
-from libs import BNB_BASE_URL, BNB_DATE_FORMAT, BNB_SPLIT_BY_MONTHS, BNB_CSV_HEADER_ROWS
-from libs.cached_exchange_rates import load_exchange_rates
+from libs import BNB_BASE_URL, BNB_SPLIT_BY_MONTHS, BNB_CONCURRENCY, BNB_RETRIES, BNB_RETRY_BACKOFF
+from libs import BNB_CURRENCY, FIXED_EXCHANGE_RATES
+from libs.rate_table import load_rate_tables, list_rate_table_years
+from libs.utils import merge_date_ranges
+from libs.bnb_client import get_bnb_client
 
 
-def query_exchange_rates(first_date, last_date):
-    logger.debug(f"Obtaining exchange rate from date range: [{first_date}] - [{last_date}]")
+def request_exchange_rates(first_date, last_date, currency=BNB_CURRENCY, base_url=BNB_BASE_URL):
+    return get_bnb_client(base_url).request_exchange_rates(first_date, last_date, currency)
 
-    params = {
-        "downloadOper": "true",
-        "group1": "second",
-        "valutes": "USD",
-        "search": "true",
-        "showChart": "false",
-        "showChartButton": "false",
-        "type": "CSV",
-    }
 
-    params["periodStartDays"] = "{:02d}".format(first_date.day)
-    params["periodStartMonths"] = "{:02d}".format(first_date.month)
-    params["periodStartYear"] = first_date.year
+def request_exchange_rates_with_retries(
+    first_date, last_date, currency=BNB_CURRENCY, base_url=BNB_BASE_URL, retries=BNB_RETRIES, retry_backoff=BNB_RETRY_BACKOFF
+):
+    attempt = 0
+    while True:
+        try:
+            return request_exchange_rates(first_date, last_date, currency, base_url)
+        except Exception:
+            if attempt >= retries:
+                raise
+
+            delay = retry_backoff * 2**attempt
+            attempt += 1
+            logger.debug(f"Request for date range [{first_date}] - [{last_date}] failed, retrying in {delay} seconds({attempt}/{retries}).")
+            time.sleep(delay)
+
+
+def get_lookback_date(first_date):
+    return first_date - relativedelta(months=1)  # Get one extra month of data to ensure there was a published exchange rate
+
+
+def split_date_range(first_date, last_date):
+    date_ranges = []
+    while True:
+        curr_fs_date = first_date
+        curr_ls_date = first_date + relativedelta(months=BNB_SPLIT_BY_MONTHS)
+        date_ranges.append((curr_fs_date, curr_ls_date))
+        first_date = curr_ls_date + relativedelta(days=1)
+
+        if first_date > last_date:
+            break
 
-    params["periodEndDays"] = "{:02d}".format(last_date.day)
-    params["periodEndMonths"] = "{:02d}".format(last_date.month)
-    params["periodEndYear"] = last_date.year
+    return date_ranges
+
+
+def download_exchange_rates(
+    first_date, last_date, currency=BNB_CURRENCY, concurrency=BNB_CONCURRENCY, base_url=BNB_BASE_URL, retry_backoff=BNB_RETRY_BACKOFF
+):
+    date_ranges = split_date_range(first_date, last_date)
 
     exchange_rates = {}
-    try:
-        response = urllib.request.urlopen(BNB_BASE_URL + urlencode(params))
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(date_ranges)))) as executor:
+        futures = [
+            executor.submit(request_exchange_rates_with_retries, curr_fs_date, curr_ls_date, currency, base_url, BNB_RETRIES, retry_backoff)
+            for curr_fs_date, curr_ls_date in date_ranges
+        ]
+
+        try:
+            for future in futures:
+                exchange_rates.update(future.result())
+        except Exception:
+            for future in futures:
+                future.cancel()
+
+            logging.exception(f"Unable to get exchange rate from BNB. Please, try again later.")
+            raise SystemExit(1)
+
+    return dict(sorted(exchange_rates.items()))
+
+
+def choose_exchange_rate(candidates, search_date):
+    previous_exchange_rate, next_exchange_rate = candidates
+
+    if previous_exchange_rate is None:
+        if next_exchange_rate is None:
+            logger.error(f"No published exchange rate found on or before [{search_date}].")
+            raise SystemExit(1)
+
+        return next_exchange_rate
+
+    if next_exchange_rate is not None and next_exchange_rate[0] - search_date < search_date - previous_exchange_rate[0]:
+        return next_exchange_rate
+
+    return previous_exchange_rate
+
 
-        data = response.read()
-        text = data.decode("utf-8")
+class RateIndex(object):
+    def __init__(self, ordinals, rates, strict=False):
+        self.ordinals = ordinals
+        self.rates = rates
+        self.strict = strict
 
-        fd = StringIO(text)
+    @classmethod
+    def from_exchange_rates(cls, exchange_rates, strict=False):
+        dates = sorted(exchange_rates.keys())
+        return cls([date.toordinal() for date in dates], [exchange_rates[date] for date in dates], strict)
 
-        reader = csv.reader(fd, delimiter=",")
+    def get(self, index):
+        return datetime.fromordinal(self.ordinals[index]), self.rates[index]
 
-        for index, row in enumerate(reader):
-            if index < BNB_CSV_HEADER_ROWS:
+    def locate(self, search_ordinal):
+        return bisect_right(self.ordinals, search_ordinal)
+
+    def get_candidates(self, search_ordinal):
+        index = self.locate(search_ordinal)
+
+        previous_exchange_rate = self.get(index - 1) if index > 0 else None
+        next_exchange_rate = self.get(index) if not self.strict and index < len(self.ordinals) else None
+        return previous_exchange_rate, next_exchange_rate
+
+    def find(self, search_date):
+        return choose_exchange_rate(self.get_candidates(search_date.toordinal()), search_date)
+
+
+class RateCalendar(RateIndex):
+    def __init__(self, ordinals, rates, strict=False, indexes=None):
+        super(RateCalendar, self).__init__(ordinals, rates, strict)
+        self.base_ordinal = ordinals[0]
+
+        if indexes is None:
+            indexes = array("i")
+            index = 0
+            for ordinal in range(ordinals[0], ordinals[-1] + 1):
+                while index + 1 < len(ordinals) and ordinals[index + 1] <= ordinal:
+                    index += 1
+                indexes.append(index)
+
+        self.indexes = indexes
+
+    def with_strict(self, strict):
+        return RateCalendar(self.ordinals, self.rates, strict, self.indexes)
+
+    def locate(self, search_ordinal):
+        offset = search_ordinal - self.base_ordinal
+        if offset < 0:
+            return 0
+
+        if offset >= len(self.indexes):
+            return len(self.ordinals)
+
+        return self.indexes[offset] + 1
+
+
+def plan_date_ranges(date_ranges, known_date_ranges=()):
+    plan = []
+    for first_ordinal, last_ordinal in merge_date_ranges(date_ranges):
+        for known_first_ordinal, known_last_ordinal in known_date_ranges:
+            if known_last_ordinal < first_ordinal or known_first_ordinal > last_ordinal:
                 continue
 
-            if not row:
+            if known_first_ordinal > first_ordinal:
+                plan.append((first_ordinal, known_first_ordinal - 1))
+
+            first_ordinal = known_last_ordinal + 1
+            if first_ordinal > last_ordinal:
+                break
+
+        if first_ordinal <= last_ordinal:
+            plan.append((first_ordinal, last_ordinal))
+
+    return plan
+
+
+class FixedRateIndex(object):
+    def __init__(self, rate):
+        self.rate = rate
+
+    def get_candidates(self, search_ordinal):
+        return (datetime.fromordinal(search_ordinal), self.rate), None
+
+    def find(self, search_date):
+        return datetime.fromordinal(search_date.toordinal()), self.rate
+
+
+class RateStore(object):
+    instance = None
+
+    def __init__(self):
+        self.concurrency = BNB_CONCURRENCY
+        self.base_url = BNB_BASE_URL
+        self.rate_cache = None
+        self.cached_rate_calendars = {}
+        self.cached_years = {}
+        self.exchange_rates = {}
+        self.known_date_ranges = {}
+        self.rate_calendars = {}
+
+    @classmethod
+    def get_instance(cls):
+        if cls.instance is None:
+            cls.instance = cls()
+
+        return cls.instance
+
+    def fetch(self, currency_date_ranges):
+        fetched = False
+        for currency, date_ranges in currency_date_ranges.items():
+            if currency in FIXED_EXCHANGE_RATES:
                 continue
 
-            date = datetime.strptime(row[0], BNB_DATE_FORMAT)
-            exchange_rates[date] = decimal.Decimal(row[3].strip())
-    except Exception:
-        logging.exception(f"Unable to get exchange rate from BNB. Please, try again later.")
-        raise SystemExit(1)
+            known_date_ranges = self.known_date_ranges.get(currency, [])
+            requested_ranges = [(get_lookback_date(first_date).toordinal(), last_date.toordinal()) for first_date, last_date in date_ranges]
+            plan = plan_date_ranges(requested_ranges, known_date_ranges)
+            logger.debug(
+                f"[{currency}] exchange rates fetch plan: {[(datetime.fromordinal(first), datetime.fromordinal(last)) for first, last in plan]}"
+            )
 
-    return exchange_rates
+            if not plan:
+                continue
 
+            fetched = True
+            exchange_rates = self.exchange_rates.setdefault(currency, {})
+            for first_ordinal, last_ordinal in plan:
+                exchange_rates.update(self.load_date_range(currency, first_ordinal, last_ordinal))
 
-def get_exchange_rates(first_date, last_date):
-    first_date -= relativedelta(months=1)  # Get one extra month of data to ensure there was a published exchange rate
-    exchange_rates = {}
-    while True:
-        curr_fs_date = first_date
-        curr_ls_date = first_date + relativedelta(months=BNB_SPLIT_BY_MONTHS)
-        exchange_rates.update(query_exchange_rates(curr_fs_date, curr_ls_date))
-        first_date = curr_ls_date + relativedelta(days=1)
+            if not exchange_rates:
+                logger.error(f"No exchange rates found for currency [{currency}].")
+                raise SystemExit(1)
 
-        if first_date > last_date:
-            break
+            self.known_date_ranges[currency] = merge_date_ranges(known_date_ranges + plan)
 
-    return exchange_rates
+            dates = sorted(exchange_rates.keys())
+            self.rate_calendars[currency] = RateCalendar([date.toordinal() for date in dates], [exchange_rates[date] for date in dates])
 
+        if fetched:
+            bnb_client = get_bnb_client(self.base_url)
+            logger.debug(
+                f"BNB online service usage: {bnb_client.requests} requests, {bnb_client.bytes_read} bytes, {bnb_client.latency:.3f}s total latency."
+            )
 
-def find_last_published_exchange_rate(exchange_rates, search_date):
-    return min(exchange_rates.keys(), key=lambda date: abs(date - search_date))
+    def download_date_range(self, currency, first_ordinal, last_ordinal):
+        return download_exchange_rates(
+            datetime.fromordinal(first_ordinal), datetime.fromordinal(last_ordinal), currency, self.concurrency, self.base_url
+        )
 
+    def load_date_range(self, currency, first_ordinal, last_ordinal):
+        if self.rate_cache is None:
+            return self.download_date_range(currency, first_ordinal, last_ordinal)
 
-def populate_exchange_rates(statements, use_bnb):
-    first_date = statements[0]["trade_date"]
-    last_date = statements[-1]["trade_date"]
+        exchange_rates = self.rate_cache.load(currency, first_ordinal, last_ordinal)
+        gaps = plan_date_ranges([(first_ordinal, last_ordinal)], self.rate_cache.get_known_date_ranges(currency))
+        logger.debug(f"[{currency}] exchange rates cache gaps: {[(datetime.fromordinal(first), datetime.fromordinal(last)) for first, last in gaps]}")
 
-    exchange_rates = {}
-    if use_bnb:
-        exchange_rates = get_exchange_rates(first_date, last_date)
-    else:
-        exchange_rates = load_exchange_rates()
+        last_published_ordinal = datetime.today().toordinal() - 1  # Today's exchange rate could still be unpublished
+        for gap_first_ordinal, gap_last_ordinal in gaps:
+            gap_exchange_rates = self.download_date_range(currency, gap_first_ordinal, gap_last_ordinal)
+            exchange_rates.update(gap_exchange_rates)
+
+            if gap_first_ordinal <= last_published_ordinal:
+                self.rate_cache.store(currency, gap_exchange_rates, gap_first_ordinal, min(gap_last_ordinal, last_published_ordinal))
+
+        return exchange_rates
+
+    def get_rate_index(self, currency, first_date, last_date, use_bnb, strict=False):
+        if currency in FIXED_EXCHANGE_RATES:
+            return FixedRateIndex(decimal.Decimal(FIXED_EXCHANGE_RATES[currency]))
+
+        if not use_bnb:
+            if currency not in self.cached_rate_calendars and not list_rate_table_years(currency):
+                logger.error(f"No cached exchange rates found for [{currency}]. Please, use BNB online service.")
+                raise SystemExit(1)
+
+            return self.get_cached_rate_calendar(currency, first_date, last_date).with_strict(strict)
+
+        self.fetch({currency: [(first_date, last_date)]})
+        return self.rate_calendars[currency].with_strict(strict)
+
+    def get_cached_rate_calendar(self, currency, first_date=None, last_date=None):
+        first_year = get_lookback_date(first_date).year if first_date is not None else None
+        # Activities after the daily publication use the next day rate, which can be on Jan 1 of the next year
+        last_year = (last_date + timedelta(days=1)).year if last_date is not None else None
+
+        if currency in self.cached_rate_calendars:
+            loaded_first_year, loaded_last_year = self.cached_years[currency]
+            if (loaded_first_year is None or (first_year is not None and loaded_first_year <= first_year)) and (
+                loaded_last_year is None or (last_year is not None and loaded_last_year >= last_year)
+            ):
+                return self.cached_rate_calendars[currency]
+
+            first_year = None if first_year is None or loaded_first_year is None else min(first_year, loaded_first_year)
+            last_year = None if last_year is None or loaded_last_year is None else max(last_year, loaded_last_year)
+
+        rate_table = load_rate_tables(first_year, last_year, currency)
+        if not rate_table:
+            logger.error(f"No cached [{currency}] exchange rates found for years [{first_year}] - [{last_year}]. Please, use BNB online service.")
+            raise SystemExit(1)
+
+        self.cached_years[currency] = (first_year, last_year)
+        self.cached_rate_calendars[currency] = RateCalendar(rate_table.ordinals, rate_table.rates)
+        return self.cached_rate_calendars[currency]
+
+    def get_rate_matrix(self, currency_date_ranges, use_bnb, strict=False):
+        if use_bnb:
+            self.fetch({currency: [date_range] for currency, date_range in currency_date_ranges.items()})
 
+        return {
+            currency: self.get_rate_index(currency, first_date, last_date, use_bnb, strict)
+            for currency, (first_date, last_date) in currency_date_ranges.items()
+        }
+
+
+def get_currency_date_ranges(statements):
+    currency_date_ranges = {}
     for statement in statements:
-        if statement["trade_date"] in exchange_rates:
-            statement["exchange_rate"] = exchange_rates[statement["trade_date"]]
-            statement["exchange_rate_date"] = statement["trade_date"]
+        currency = statement["currency"]
+        trade_date = statement["trade_date"]
+
+        if currency not in currency_date_ranges:
+            currency_date_ranges[currency] = (trade_date, trade_date)
             continue
 
-        statement["exchange_rate_date"] = find_last_published_exchange_rate(exchange_rates, statement["trade_date"])
-        statement["exchange_rate"] = exchange_rates[statement["exchange_rate_date"]]
+        first_date, last_date = currency_date_ranges[currency]
+        if trade_date < first_date:
+            currency_date_ranges[currency] = (trade_date, last_date)
+        elif trade_date > last_date:
+            currency_date_ranges[currency] = (first_date, trade_date)
+
+    return currency_date_ranges
+
+
+def get_rate_calendar(currency=BNB_CURRENCY, use_bnb=False, first_date=None, last_date=None, strict=False):
+    rate_store = RateStore.get_instance()
+
+    if not use_bnb or currency in FIXED_EXCHANGE_RATES:
+        return rate_store.get_rate_index(currency, first_date, last_date, use_bnb, strict)
+
+    if first_date is not None and last_date is not None:
+        rate_store.fetch({currency: [(first_date, last_date)]})
+
+    if currency not in rate_store.rate_calendars:
+        logger.error(f"No exchange rates obtained from BNB online service for currency [{currency}].")
+        raise SystemExit(1)
+
+    return rate_store.rate_calendars[currency].with_strict(strict)
+
+
+class RateResolver(object):
+    def __init__(self, rate_matrix):
+        self.rate_matrix = rate_matrix
+        self.memo = {}
+        self.counters = {"exact": 0, "memo": 0, "fallback": 0}
+        self.timings = {"exact": 0.0, "memo": 0.0, "fallback": 0.0}
+
+    def resolve(self, currency, trade_date):
+        start_time = time.perf_counter()
+
+        key = (currency, trade_date.toordinal())
+        candidates = self.memo.get(key)
+        resolution = "memo"
+        if candidates is None:
+            candidates = self.rate_matrix[currency].get_candidates(key[1])
+            self.memo[key] = candidates
+            resolution = "fallback"
+
+        exchange_rate = choose_exchange_rate(candidates, trade_date)
+        if exchange_rate[0] == trade_date:
+            resolution = "exact"
+
+        self.counters[resolution] += 1
+        self.timings[resolution] += time.perf_counter() - start_time
+        return exchange_rate
+
+    def report(self):
+        for resolution, count in self.counters.items():
+            if count:
+                logger.debug(f"Exchange rates resolution[{resolution}]: {count} statements in {self.timings[resolution]:.6f}s.")
+
+        logger.debug(f"Exchange rates resolution memo size: {len(self.memo)} dates.")
+
+
+def populate_exchange_rates(statements, use_bnb, strict=False):
+    rate_resolver = RateResolver(RateStore.get_instance().get_rate_matrix(get_currency_date_ranges(statements), use_bnb, strict))
+
+    for statement in statements:
+        statement["exchange_rate_date"], statement["exchange_rate"] = rate_resolver.resolve(statement["currency"], statement["trade_date"])
+
+    rate_resolver.report()
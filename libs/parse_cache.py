@@ -0,0 +1,48 @@
+import os
+import pickle
+import hashlib
+import logging
+
+from libs.activity import Activity
+
+logger = logging.getLogger("parsers")
+
+PARSE_CACHE_BUFFER_SIZE = 1024 * 1024
+
+
+def get_file_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as fd:
+        for chunk in iter(lambda: fd.read(PARSE_CACHE_BUFFER_SIZE), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class ParseCache(object):
+    def __init__(self, cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+
+    def get_file_path(self, parser_name, parser_version, digest):
+        return os.path.join(self.cache_dir, f"{parser_name}-{parser_version}-{digest}.pickle")
+
+    def load(self, parser_name, parser_version, digest):
+        file_path = self.get_file_path(parser_name, parser_version, digest)
+        if not os.path.exists(file_path):
+            return None
+
+        try:
+            with open(file_path, "rb") as fd:
+                return [Activity(*activity) for activity in pickle.load(fd)]
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable parse cache file[{file_path}]: {e}")
+            return None
+
+    def store(self, parser_name, parser_version, digest, activities):
+        file_path = self.get_file_path(parser_name, parser_version, digest)
+
+        with open(file_path + ".tmp", "wb") as fd:
+            pickle.dump([activity.to_tuple() for activity in activities], fd, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(file_path + ".tmp", file_path)
@@ -0,0 +1,43 @@
+import sys
+import importlib
+from collections.abc import Mapping
+from pkgutil import iter_modules
+
+# Parser modules of frozen builds, which can't be discovered from the package directory
+FROZEN_PARSER_MODULES = {
+    "revolut": "libs.parsers.revolut",
+    "trading212": "libs.parsers.trading212",
+    "passfolio": "libs.parsers.passfolio",
+    "csv": "libs.parsers.csv",
+}
+
+
+def list_parser_modules():
+    if getattr(sys, "frozen", False):
+        return dict(FROZEN_PARSER_MODULES)
+
+    return {module.name.split(".")[-1]: module.name for module in iter_modules(__path__, f"{__name__}.") if not module.name.endswith("parser")}
+
+
+class ParserRegistry(Mapping):
+    def __init__(self, parser_modules):
+        self.parser_modules = parser_modules
+        self.parsers = {}
+
+    def __getitem__(self, parser_name):
+        if parser_name not in self.parsers:
+            self.parsers[parser_name] = importlib.import_module(self.parser_modules[parser_name]).Parser
+
+        return self.parsers[parser_name]
+
+    def __iter__(self):
+        return iter(self.parser_modules)
+
+    def __len__(self):
+        return len(self.parser_modules)
+
+    def __repr__(self):
+        return repr(list(self.parser_modules))
+
+
+supported_parsers = ParserRegistry(list_parser_modules())
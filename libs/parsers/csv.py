@@ -2,12 +2,14 @@ import csv
 from datetime import datetime, timedelta
 import logging
 import decimal
+from operator import itemgetter
 
 decimal.getcontext().rounding = decimal.ROUND_HALF_UP
 
 from libs import RECEIVED_DIVIDEND_ACTIVITY_TYPES, TAX_DIVIDEND_ACTIVITY_TYPES
-from libs.utils import list_statement_files
-from libs.parsers.parser import StatementFilesParser
+from libs.activity import Activity
+from libs.dates import get_date_parser
+from libs.parsers.parser import StatementFilesParser, parse_number
 
 logger = logging.getLogger("parsers")
 
@@ -24,18 +26,32 @@ CSV_REQUIRED_COLUMNS = ["trade_date", "activity_type", "company", "symbol", "qua
 
 
 class Parser(StatementFilesParser):
-    def parse_date(self, date_string):
+    stream_statement_files = True
+
+    @staticmethod
+    def matches_header(header_row):
+        columns = {column_name.replace(" ", "_").lower() for column_name in header_row}
+        return all(required_column in columns for required_column in CSV_REQUIRED_COLUMNS)
+
+    def detect_date_format(self, date_string):
         for date_format in CSV_DATE_FORMATS:
             try:
-                return datetime.strptime(date_string, date_format)
+                get_date_parser(date_format)(date_string)
+                return date_format
             except ValueError:
                 pass
 
         logger.error(f"Unable to parse date: [{date_string}].")
         raise SystemExit(1)
 
-    def clean_number(self, number_string):
-        return number_string.replace("(", "").replace(")", "").replace(",", "")
+    def parse_date(self, date_string, date_format=None):
+        if date_format is not None:
+            try:
+                return get_date_parser(date_format)(date_string)
+            except ValueError:
+                logger.debug(f"Date [{date_string}] does not match the detected date format[{date_format}].")
+
+        return get_date_parser(self.detect_date_format(date_string))(date_string)
 
     def read_headers(self, header_row):
         headers = {column_name.replace(" ", "_").lower(): index for index, column_name in enumerate(header_row)}
@@ -51,57 +67,39 @@ class Parser(StatementFilesParser):
 
         return headers
 
-    def extract_activities(self, viewer):
-        activities = []
-
-        headers = None
-        for index, row in enumerate(viewer):
-            if index == 0:
-                headers = self.read_headers(row)
-
-            if not row:
-                continue
-
-            if row[headers["activity_type"]] in CSV_ACTIVITY_TYPES:
-                activity = {
-                    "trade_date": self.parse_date(row[headers["trade_date"]]),
-                    "settle_date": "-",
-                    "currency": "USD",
-                    "activity_type": row[headers["activity_type"]],
-                    "symbol": row[headers["symbol"]],
-                    "company": row[headers["company"]],
-                    "symbol_description": row[headers["symbol_description"]],
-                    "quantity": decimal.Decimal(self.clean_number(row[headers["quantity"]])),
-                    "price": decimal.Decimal(self.clean_number(row[headers["price"]])),
-                    "amount": decimal.Decimal(self.clean_number(row[headers["amount"]])),
-                }
-
-                activities.append(activity)
-
-        return activities
-
-    def parse(self):
-        statements = []
-
-        statement_files = list_statement_files(self.input_dir, "csv")
-        if not statement_files:
-            logger.error(f"No statement files found.")
-            raise SystemExit(1)
+    def compile_row_extractor(self, header_row, statement_file):
+        headers = self.read_headers(header_row)
+
+        activity_types = frozenset(CSV_ACTIVITY_TYPES)
+        get_columns = itemgetter(*[headers[column] for column in CSV_REQUIRED_COLUMNS])
+        date_format = None
+
+        def extract_activity(row):
+            nonlocal date_format
 
-        logger.info(f"Collected statement files for processing: {statement_files}.")
+            trade_date, activity_type, company, symbol, quantity, price, amount, symbol_description = get_columns(row)
+            if activity_type not in activity_types:
+                return None
 
-        for statement_file in statement_files:
-            logger.debug(f"Processing statement file[{statement_file}]")
+            if date_format is None:
+                date_format = self.detect_date_format(trade_date)
+                logger.info(f"Detected statement date format[{date_format}].")
 
-            with open(statement_file, "r") as fd:
-                viewer = csv.reader(fd, delimiter=",")
-                activities = self.extract_activities(viewer)
-                if not activities:
-                    continue
-                statements.extend(activities)
+            return Activity(
+                trade_date=self.parse_date(trade_date, date_format),
+                settle_date="-",
+                currency="USD",
+                activity_type=activity_type,
+                symbol=symbol,
+                company=company,
+                symbol_description=symbol_description,
+                quantity=parse_number(quantity),
+                price=parse_number(price),
+                amount=parse_number(amount),
+            )
 
-        return statements
+        return extract_activity
 
     @staticmethod
     def get_unsupported_activity_types(statements):
-        return []
\ No newline at end of file
+        return []
@@ -1,9 +1,192 @@
+import csv
+import heapq
+import logging
+import decimal
+from collections import Counter
+from itertools import chain
+from operator import itemgetter
+from concurrent.futures import ProcessPoolExecutor
+
+decimal.getcontext().rounding = decimal.ROUND_HALF_UP
+
+from libs.activity import Activity
+from libs.parse_cache import get_file_digest
+from libs.utils import scan_statement_files
+
+logger = logging.getLogger("parsers")
+
+NUMBER_TRANSLATION = str.maketrans("", "", "(),")
+
+
+def parse_number(number_string):
+    return decimal.Decimal(number_string.translate(NUMBER_TRANSLATION))
+
+
+def get_activity_fingerprint(activity):
+    return activity["trade_date"], activity["activity_type"], activity["symbol"], activity["quantity"], activity["price"], activity["amount"]
+
+
+def parse_statement_file_batch(parser_class, input_dir, statement_file):
+    # Workers get a bare parser, the statement files list and the parse cache are only needed by the main process
+    return [activity.to_tuple() for activity in parser_class(input_dir).parse_statement_file(statement_file)]
+
+
 class StatementFilesParser(object):
-    def __init__(self, input_dir):
+    # Bump when parsed activities change, so parse cache entries of previous versions are not used
+    parser_version = 1
+    stream_statement_files = False
+
+    def __init__(self, input_dir, workers=None, parse_cache=None, statement_files=None, deduplicate=False):
         self.input_dir = input_dir
+        self.workers = workers
+        self.parse_cache = parse_cache
+        self.statement_files = statement_files
+        self.deduplicate = deduplicate
+        self.parser_name = type(self).__module__.split(".")[-1]
+
+    def list_statement_files(self):
+        statement_files = self.statement_files
+        if statement_files is None:
+            statement_files = scan_statement_files(self.input_dir, "csv")
+
+        if not statement_files:
+            logger.error(f"No statement files found.")
+            raise SystemExit(1)
+
+        logger.info(f"Collected statement files for processing: {[statement_file.path for statement_file in statement_files]}.")
+        logger.debug(f"Collected {len(statement_files)} statement files, {sum(statement_file.size for statement_file in statement_files)} bytes.")
+        return [statement_file.path for statement_file in statement_files]
+
+    def compile_row_extractor(self, header_row, statement_file):
+        return None
+
+    @staticmethod
+    def matches_header(header_row):
+        return False
+
+    def extract_activities(self, viewer, statement_file=None):
+        extract_activity = None
+        for index, row in enumerate(viewer):
+            if index == 0:
+                extract_activity = self.compile_row_extractor(row, statement_file)
+                if extract_activity is None:
+                    return
+
+                continue
+
+            if not row:
+                continue
+
+            activity = extract_activity(row)
+            if activity is not None:
+                yield activity
+
+    def iter_statement_file(self, statement_file):
+        logger.debug(f"Processing statement file[{statement_file}]")
+
+        # Statement files exported by spreadsheet applications often start with a BOM
+        with open(statement_file, "r", encoding="utf-8-sig") as fd:
+            viewer = csv.reader(fd, delimiter=",")
+            yield from self.extract_activities(viewer, statement_file)
+
+    def parse_statement_file(self, statement_file):
+        return list(self.iter_statement_file(statement_file))
+
+    def parse_new_statement_files(self, statement_files):
+        if not self.workers or self.workers < 2 or len(statement_files) < 2:
+            return [self.parse_statement_file(statement_file) for statement_file in statement_files]
+
+        logger.debug(f"Parsing {len(statement_files)} statement files with {self.workers} processes.")
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            batches = executor.map(
+                parse_statement_file_batch, [type(self)] * len(statement_files), [self.input_dir] * len(statement_files), statement_files
+            )
+            return [[Activity(*activity) for activity in batch] for batch in batches]
+
+    def parse_statement_files(self, statement_files):
+        if self.parse_cache is None:
+            return self.parse_new_statement_files(statement_files)
+
+        digests = {statement_file: get_file_digest(statement_file) for statement_file in statement_files}
+
+        statements = {}
+        for statement_file in statement_files:
+            activities = self.parse_cache.load(self.parser_name, self.parser_version, digests[statement_file])
+            if activities is not None:
+                statements[statement_file] = activities
+
+        new_statement_files = [statement_file for statement_file in statement_files if statement_file not in statements]
+        logger.info(f"Loaded {len(statements)} statement files from parse cache, parsing {len(new_statement_files)} new or changed statement files.")
+
+        for statement_file, activities in zip(new_statement_files, self.parse_new_statement_files(new_statement_files)):
+            self.parse_cache.store(self.parser_name, self.parser_version, digests[statement_file], activities)
+            statements[statement_file] = activities
+
+        return [statements[statement_file] for statement_file in statement_files]
+
+    def get_sorting_keys(self, statements):
+        return [[activity["trade_date"] for activity in activities] for activities in statements]
+
+    def merge_statements(self, statements):
+        streams = []
+        for activities, sorting_keys in zip(statements, self.get_sorting_keys(statements)):
+            stream = list(zip(sorting_keys, activities))
+            if any(previous[0] > current[0] for previous, current in zip(stream, stream[1:])):
+                stream.sort(key=itemgetter(0))
+
+            streams.append(stream)
+
+        # heapq.merge is stable, so activities with equal keys keep their file and row order
+        return map(itemgetter(1), heapq.merge(*streams, key=itemgetter(0)))
+
+    def sort_statements(self, statements):
+        return chain.from_iterable(statements)
+
+    def deduplicate_activities(self, statement_file, activities, known_fingerprints):
+        # Identical activities within a statement file are kept. Only the ones already reported by previous statement files are dropped.
+        fingerprints = Counter()
+        duplicates = 0
+        for activity in activities:
+            fingerprint = get_activity_fingerprint(activity)
+            fingerprints[fingerprint] += 1
+            if fingerprints[fingerprint] <= known_fingerprints[fingerprint]:
+                duplicates += 1
+                continue
+
+            yield activity
+
+        for fingerprint, count in fingerprints.items():
+            if count > known_fingerprints[fingerprint]:
+                known_fingerprints[fingerprint] = count
+
+        if duplicates:
+            logger.warning(f"Dropped {duplicates} duplicate activities from statement file[{statement_file}].")
+
+    def iter_activities(self):
+        statement_files = self.list_statement_files()
+        known_fingerprints = Counter()
+
+        if self.stream_statement_files and (not self.workers or self.workers < 2) and self.parse_cache is None:
+            for statement_file in statement_files:
+                activities = self.iter_statement_file(statement_file)
+                if self.deduplicate:
+                    activities = self.deduplicate_activities(statement_file, activities, known_fingerprints)
+
+                yield from activities
+            return
+
+        statements = self.parse_statement_files(statement_files)
+        if self.deduplicate:
+            statements = [
+                list(self.deduplicate_activities(statement_file, activities, known_fingerprints))
+                for statement_file, activities in zip(statement_files, statements)
+            ]
+
+        statements = [activities for activities in statements if activities]
+        yield from self.sort_statements(statements)
 
     def parse(self):
-        pass
+        return list(self.iter_activities())
 
     @staticmethod
     def get_unsupported_activity_types(self):
@@ -1,9 +1,12 @@
 # Author Borislav Gizdov <borislav.gizdov@gmail.com>
-from libs.parsers.parser import StatementFilesParser
-from libs.utils import list_statement_files
+from libs.activity import Activity
+from libs.dates import get_iso_date_parser
+from libs.parsers.parser import StatementFilesParser, parse_number
 from libs import RECEIVED_DIVIDEND_ACTIVITY_TYPES, TAX_DIVIDEND_ACTIVITY_TYPES
 import csv
+import os
 from datetime import datetime, timedelta
+from operator import itemgetter
 import logging
 import decimal
 
@@ -12,32 +15,64 @@ decimal.getcontext().rounding = decimal.ROUND_HALF_UP
 
 logger = logging.getLogger("parsers")
 
-RECEIVED_DIVIDEND_ACTIVITY_TYPES = [
-    "DIV", "DIVIDEND", "DIVCGL", "DIVCGS", "DIVROC", "DIVTXEX"]
+RECEIVED_DIVIDEND_ACTIVITY_TYPES = ["DIV", "DIVIDEND", "DIVCGL", "DIVCGS", "DIVROC", "DIVTXEX"]
 TAX_DIVIDEND_ACTIVITY_TYPES = ["DIVNRA", "DIVFT", "DIVTW"]
 
 PASSFOLIO_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
-PASSFOLIO_ACTIVITY_TYPES = [
-    "SELL", "BUY"] + RECEIVED_DIVIDEND_ACTIVITY_TYPES + TAX_DIVIDEND_ACTIVITY_TYPES
+PASSFOLIO_ACTIVITY_TYPES = ["SELL", "BUY"] + RECEIVED_DIVIDEND_ACTIVITY_TYPES + TAX_DIVIDEND_ACTIVITY_TYPES
 PASSFOLIO_CASH_ACTIVITY_TYPES = []
 PASSFOLIO_OUT_OF_ORDER_ACTIVITY_TYPES = []
 PASSFOLIO_UNSUPPORTED_ACTIVITY_TYPES = []
 PASSFOLIO_ACTIVITIES_PAGES_INDICATORS = []
 PASSFOLIO_DIGIT_PRECISION = "0.00000001"
 
-ORDERS_REQUIRED_COLUMNS = ["orderId", "enteredAt", "executedAt", "status", "side",
-                           "type", "symbol", "filledQuantity", "quantity", "amount", "price", "service", "feesUSD"]
-DIVIDENDS_REQUIRED_COLUMNS = ["receivedAt", "reinvested", "reinvestedAt", "reinvestedAmount", "isAdjustment",
-                              "amount", "amountPerShare", "symbol", "type", "taxCode", "description", "taxAmount", "taxRate"]
+ORDERS_REQUIRED_COLUMNS = [
+    "orderId",
+    "enteredAt",
+    "executedAt",
+    "status",
+    "side",
+    "type",
+    "symbol",
+    "filledQuantity",
+    "quantity",
+    "amount",
+    "price",
+    "service",
+    "feesUSD",
+]
+DIVIDENDS_REQUIRED_COLUMNS = [
+    "receivedAt",
+    "reinvested",
+    "reinvestedAt",
+    "reinvestedAmount",
+    "isAdjustment",
+    "amount",
+    "amountPerShare",
+    "symbol",
+    "type",
+    "taxCode",
+    "description",
+    "taxAmount",
+    "taxRate",
+]
+
+parse_passfolio_date = get_iso_date_parser(PASSFOLIO_DATE_FORMAT, naive=True)
 
 
 class ActivitiesNotFound(Exception):
     pass
 
+
 class Parser(StatementFilesParser):
+    parser_version = 2
+
+    @staticmethod
+    def matches_header(header_row):
+        return "orderId" in header_row or "receivedAt" in header_row
+
     def read_headers(self, header_row, required_columns):
-        headers = {column_name.replace(
-            " ", "_"): index for index, column_name in enumerate(header_row)}
+        headers = {column_name.replace(" ", "_"): index for index, column_name in enumerate(header_row)}
 
         missing_required_columns = []
         for required_column in required_columns:
@@ -45,100 +80,95 @@ class Parser(StatementFilesParser):
                 missing_required_columns.append(required_column)
 
         if missing_required_columns:
-            logger.error(
-                f"Found missing required columns: {missing_required_columns}.")
+            logger.error(f"Found missing required columns: {missing_required_columns}.")
             raise SystemExit(1)
 
         return headers
 
-    def clean_number(self, number_string):
-        return number_string.replace("(", "").replace(")", "").replace(",", "")
-
-    def extract_activities(self, viewer, file_name):
-        activities = []
-
-        headers = None
-
-        for index, row in enumerate(viewer):
-            if "orders" in file_name:
-                if index == 0 and "orders" in file_name:
-                    headers = self.read_headers(row, ORDERS_REQUIRED_COLUMNS)
-                if index < 1:
-                    continue
-
-                if not row:
-                    continue
-
-                if row[headers["enteredAt"]] == '' or row[headers["executedAt"]] == '':
-                    continue
-
-                if row[headers["side"]] in PASSFOLIO_ACTIVITY_TYPES:
-                    activity = {
-                        "trade_date": datetime.strptime(row[headers["enteredAt"]], PASSFOLIO_DATE_FORMAT).replace(tzinfo=None),
-                        "settle_date": datetime.strptime(row[headers["executedAt"]], PASSFOLIO_DATE_FORMAT).replace(tzinfo=None),
-                        "currency": 'USD',
-                        "activity_type": row[headers["side"]],
-                        "symbol_description": row[headers["symbol"]],
-                        "symbol": row[headers["symbol"]],
-                        "quantity": decimal.Decimal(self.clean_number(row[headers["quantity"]])),
-                        "price": decimal.Decimal(self.clean_number(row[headers["price"]])),
-                        "amount": decimal.Decimal(self.clean_number(row[headers["amount"]])),
-                        "company": row[6],
-                    }
-
-                    activities.append(activity)
-
-            if "dividends" in file_name:
-                if index == 0 and "dividends" in file_name:
-                    headers = self.read_headers(
-                        row, DIVIDENDS_REQUIRED_COLUMNS)
-
-                if index < 1:
-                    continue
-
-                if not row:
-                    continue
-
-                activity = {
-                    "trade_date": datetime.strptime(row[headers["receivedAt"]], PASSFOLIO_DATE_FORMAT).replace(tzinfo=None),
-                    "settle_date": datetime.strptime(row[headers["receivedAt"]], PASSFOLIO_DATE_FORMAT).replace(tzinfo=None),
-                    "currency": 'USD',
-                    "activity_type": 'DIV',
-                    "symbol_description": row[headers["description"]],
-                    "symbol": row[headers["symbol"]],
-                    "quantity":  decimal.Decimal(self.clean_number(row[headers["amount"]])) * decimal.Decimal(self.clean_number(row[headers["amountPerShare"]])),
-                    "price": decimal.Decimal(self.clean_number(row[headers["amountPerShare"]])),
-                    "amount": decimal.Decimal(self.clean_number(row[headers["amount"]])),
-                    "company": row[6],
-                }
-
-                activities.append(activity)
-
-        return activities
-
-    def parse(self):
-        statements = []
-
-        statement_files = list_statement_files(self.input_dir, "csv")
-        if not statement_files:
-            logger.error(f"No statement files found.")
-            raise SystemExit(1)
-
-        logger.info(
-            f"Collected statement files for processing: {statement_files}.")
-
-        for statement_file in statement_files:
-            logger.debug(f"Processing statement file[{statement_file}]")
-
-            with open(statement_file, "r") as fd:
-                viewer = csv.reader(fd, delimiter=",")
-                activities = self.extract_activities(viewer, statement_file)
-                if not activities:
-                    continue
-                statements.append(activities)
-
-        statements = sorted(statements, key=lambda k: k[0]["trade_date"])
-        return [activity for activities in statements for activity in activities]
+    def get_statement_type(self, header_row, statement_file):
+        if "orderId" in header_row:
+            return "orders"
+
+        if "receivedAt" in header_row:
+            return "dividends"
+
+        file_name = os.path.basename(statement_file or "")
+        for statement_type in ["orders", "dividends"]:
+            if statement_type in file_name:
+                return statement_type
+
+        logger.warning(f"Unable to detect statement type of statement file[{statement_file}], skipping it.")
+        return None
+
+    def compile_row_extractor(self, header_row, statement_file):
+        statement_type = self.get_statement_type(header_row, statement_file)
+        if statement_type == "orders":
+            return self.compile_orders_row_extractor(self.read_headers(header_row, ORDERS_REQUIRED_COLUMNS))
+
+        if statement_type == "dividends":
+            return self.compile_dividends_row_extractor(self.read_headers(header_row, DIVIDENDS_REQUIRED_COLUMNS))
+
+        return None
+
+    def compile_orders_row_extractor(self, headers):
+        activity_types = frozenset(PASSFOLIO_ACTIVITY_TYPES)
+        get_columns = itemgetter(
+            headers["enteredAt"],
+            headers["executedAt"],
+            headers["side"],
+            headers["symbol"],
+            headers["quantity"],
+            headers["price"],
+            headers["amount"],
+            6,
+        )
+
+        def extract_activity(row):
+            entered_at, executed_at, side, symbol, quantity, price, amount, company = get_columns(row)
+            if entered_at == "" or executed_at == "" or side not in activity_types:
+                return None
+
+            return Activity(
+                trade_date=parse_passfolio_date(entered_at),
+                settle_date=parse_passfolio_date(executed_at),
+                currency="USD",
+                activity_type=side,
+                symbol_description=symbol,
+                symbol=symbol,
+                quantity=parse_number(quantity),
+                price=parse_number(price),
+                amount=parse_number(amount),
+                company=company,
+            )
+
+        return extract_activity
+
+    def compile_dividends_row_extractor(self, headers):
+        get_columns = itemgetter(headers["receivedAt"], headers["description"], headers["symbol"], headers["amount"], headers["amountPerShare"], 6)
+
+        def extract_activity(row):
+            received_at, description, symbol, amount, amount_per_share, company = get_columns(row)
+
+            trade_date = parse_passfolio_date(received_at)
+            amount = parse_number(amount)
+            price = parse_number(amount_per_share)
+            return Activity(
+                trade_date=trade_date,
+                settle_date=trade_date,
+                currency="USD",
+                activity_type="DIV",
+                symbol_description=description,
+                symbol=symbol,
+                quantity=amount * price,
+                price=price,
+                amount=amount,
+                company=company,
+            )
+
+        return extract_activity
+
+    def sort_statements(self, statements):
+        return self.merge_statements(statements)
 
     @staticmethod
     def get_unsupported_activity_types(statements):
@@ -3,12 +3,13 @@ from datetime import datetime, timedelta
 import re
 import logging
 import decimal
-
+from operator import itemgetter
 
 decimal.getcontext().rounding = decimal.ROUND_HALF_UP
 
 from libs import RECEIVED_DIVIDEND_ACTIVITY_TYPES, TAX_DIVIDEND_ACTIVITY_TYPES
-from libs.utils import list_statement_files
+from libs.activity import Activity
+from libs.dates import get_date_parser
 from libs.parsers.parser import StatementFilesParser
 
 logger = logging.getLogger("parsers")
@@ -22,88 +23,72 @@ REVOLUT_UNSUPPORTED_ACTIVITY_TYPES = ["NC", "MA"]
 REVOLUT_NO_COMPANY_ACTIVITY_TYPES = ["SSO"]
 REVOLUT_DIGIT_PRECISION = "0.00000001"
 
+parse_revolut_date = get_date_parser(REVOLUT_DATE_FORMAT)
+
 
 class ActivitiesNotFound(Exception):
     pass
 
 
 class Parser(StatementFilesParser):
-    def extract_activities(self, viewer):
-        activities = []
-
-        for index, row in enumerate(viewer):
-            if index < 1:
-                continue
-
-            if not row:
-                continue
-
-            if row[2] in REVOLUT_ACTIVITY_TYPES:
-                activity = {
-                    "trade_date": datetime.strptime(row[0], REVOLUT_DATE_FORMAT),
-                    "settle_date": datetime.strptime(row[0], REVOLUT_DATE_FORMAT),
-                    "currency": row[6],
-                    "activity_type": row[2],
-                    "symbol_description": row[1],
-                    "symbol": row[1],
-                    "quantity": decimal.Decimal(row[3]) if row[3] else None,
-                    "price": decimal.Decimal(row[4]) if row[4] else None,
-                    "amount": decimal.Decimal(row[5]),
-                    "company": row[1],
-                }
-
-                activities.append(activity)
-
-        return activities
-
-    def get_first_non_out_of_order_activity_index(self, statements):
-        for index, statement in enumerate(statements):
-            if statement["activity_type"] not in REVOLUT_OUT_OF_ORDER_ACTIVITY_TYPES:
-                return index
-
-        return None
-
-    def get_sorting_date(self, statements):
-        sorting_index = self.get_first_non_out_of_order_activity_index(statements)
-
-        if sorting_index is None:
-            if not self.sorting_dates:
-                logger.error("No previous purchase information found for out of order activities.")
-                raise SystemExit(1)
-
-            return self.sorting_dates[-1]
-
-        trade_date = statements[sorting_index]["trade_date"]
-        self.sorting_dates.append(trade_date)
-        return trade_date
-
-    def parse(self):
-        statements = []
-
-        statement_files = list_statement_files(self.input_dir, "csv")
-        if not statement_files:
-            logger.error(f"No statement files found.")
-            raise SystemExit(1)
-
-        logger.info(f"Collected statement files for processing: {statement_files}.")
-
-        for statement_file in statement_files:
-            logger.debug(f"Processing statement file[{statement_file}]")
-
-            with open(statement_file, "r") as fd:
-                viewer = csv.reader(fd, delimiter=",")
-                activities = self.extract_activities(viewer)
-                if not activities:
-                    continue
-                statements.append(activities)
-
-        self.sorting_dates = []
-        statements = sorted(statements, key=lambda k: self.get_sorting_date(k))
-
-        from pprint import pprint
-
-        print(pprint(statements))
-        return [activity for activities in statements for activity in activities]
+    @staticmethod
+    def matches_header(header_row):
+        return header_row[:3] == ["Date", "Ticker", "Type"]
+
+    def compile_row_extractor(self, header_row, statement_file):
+        activity_types = frozenset(REVOLUT_ACTIVITY_TYPES)
+        get_columns = itemgetter(0, 1, 2, 3, 4, 5, 6)
+        to_decimal = decimal.Decimal
+
+        def extract_activity(row):
+            date, symbol, activity_type, quantity, price, amount, currency = get_columns(row)
+            if activity_type not in activity_types:
+                return None
+
+            trade_date = parse_revolut_date(date)
+            return Activity(
+                trade_date=trade_date,
+                settle_date=trade_date,
+                currency=currency,
+                activity_type=activity_type,
+                symbol_description=symbol,
+                symbol=symbol,
+                quantity=to_decimal(quantity) if quantity else None,
+                price=to_decimal(price) if price else None,
+                amount=to_decimal(amount),
+                company=symbol,
+            )
+
+        return extract_activity
+
+    def get_sorting_keys(self, statements):
+        # Out of order activities take the date of the preceding activity in the statement file.
+        # When a statement file starts with them, the first in order activity date is used instead.
+        sorting_keys = []
+        for activities in statements:
+            sorting_date = next(
+                (activity["trade_date"] for activity in activities if activity["activity_type"] not in REVOLUT_OUT_OF_ORDER_ACTIVITY_TYPES), None
+            )
+            if sorting_date is None:
+                if not sorting_keys:
+                    logger.error("No previous purchase information found for out of order activities.")
+                    raise SystemExit(1)
+
+                sorting_date = sorting_keys[-1][-1]
+
+            file_sorting_keys = []
+            for activity in activities:
+                if activity["activity_type"] not in REVOLUT_OUT_OF_ORDER_ACTIVITY_TYPES:
+                    sorting_date = activity["trade_date"]
+
+                file_sorting_keys.append(sorting_date)
+
+            sorting_keys.append(file_sorting_keys)
+
+        return sorting_keys
+
+    def sort_statements(self, statements):
+        return self.merge_statements(statements)
 
     @staticmethod
     def get_unsupported_activity_types(statements):
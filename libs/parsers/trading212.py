@@ -2,12 +2,13 @@ import csv
 from datetime import datetime, timedelta
 import logging
 import decimal
-
+from operator import itemgetter
 
 decimal.getcontext().rounding = decimal.ROUND_HALF_UP
 
-from libs.utils import list_statement_files
-from libs.parsers.parser import StatementFilesParser
+from libs.activity import Activity
+from libs.dates import get_date_parser
+from libs.parsers.parser import StatementFilesParser, parse_number
 
 logger = logging.getLogger("parsers")
 
@@ -19,65 +20,45 @@ TRADING212_UNSUPPORTED_ACTIVITY_TYPES = []
 TRADING212_ACTIVITIES_PAGES_INDICATORS = []
 TRADING212_DIGIT_PRECISION = "0.00000001"
 
+parse_trading212_date = get_date_parser(TRADING212_DATE_FORMAT)
+
 
 class ActivitiesNotFound(Exception):
     pass
 
 
 class Parser(StatementFilesParser):
-    def clean_number(self, number_string):
-        return number_string.replace("(", "").replace(")", "").replace(",", "")
-
-    def extract_activities(self, viewer):
-        activities = []
-
-        for index, row in enumerate(viewer):
-            if index < 1:
-                continue
-
-            if not row:
-                continue
-
-            if row[0] in TRADING212_ACTIVITY_TYPES:
-                activity = {
-                    "trade_date": datetime.strptime(row[1], TRADING212_DATE_FORMAT),
-                    "settle_date": "-",
-                    "currency": row[7],
-                    "activity_type": TRADING212_ACTIVITY_TYPES[row[0]],
-                    "symbol_description": row[4] + " " + row[2],
-                    "symbol": row[3],
-                    "quantity": decimal.Decimal(row[5]),
-                    "price": decimal.Decimal(row[6]),
-                    "amount": decimal.Decimal(self.clean_number(row[10])),
-                    "company": row[4],
-                }
-
-                activities.append(activity)
-
-        return activities
-
-    def parse(self):
-        statements = []
-
-        statement_files = list_statement_files(self.input_dir, "csv")
-        if not statement_files:
-            logger.error(f"No statement files found.")
-            raise SystemExit(1)
-
-        logger.info(f"Collected statement files for processing: {statement_files}.")
-
-        for statement_file in statement_files:
-            logger.debug(f"Processing statement file[{statement_file}]")
-
-            with open(statement_file, "r") as fd:
-                viewer = csv.reader(fd, delimiter=",")
-                activities = self.extract_activities(viewer)
-                if not activities:
-                    continue
-                statements.append(activities)
-
-        statements = sorted(statements, key=lambda k: k[0]["trade_date"])
-        return [activity for activities in statements for activity in activities]
+    @staticmethod
+    def matches_header(header_row):
+        return header_row[:1] == ["Action"]
+
+    def compile_row_extractor(self, header_row, statement_file):
+        activity_types = TRADING212_ACTIVITY_TYPES
+        get_columns = itemgetter(0, 1, 2, 3, 4, 5, 6, 7, 10)
+        to_decimal = decimal.Decimal
+
+        def extract_activity(row):
+            action, date, isin, symbol, company, quantity, price, currency, amount = get_columns(row)
+            if action not in activity_types:
+                return None
+
+            return Activity(
+                trade_date=parse_trading212_date(date),
+                settle_date="-",
+                currency=currency,
+                activity_type=activity_types[action],
+                symbol_description=company + " " + isin,
+                symbol=symbol,
+                quantity=to_decimal(quantity),
+                price=to_decimal(price),
+                amount=parse_number(amount),
+                company=company,
+            )
+
+        return extract_activity
+
+    def sort_statements(self, statements):
+        return self.merge_statements(statements)
 
     @staticmethod
     def get_unsupported_activity_types(statements):
@@ -86,4 +67,4 @@ class Parser(StatementFilesParser):
             if statement["activity_type"] in TRADING212_UNSUPPORTED_ACTIVITY_TYPES:
                 unsupported_activity_types.append(statement["activity_type"])
 
-        return list(set(unsupported_activity_types))
\ No newline at end of file
+        return list(set(unsupported_activity_types))
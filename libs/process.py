@@ -1,34 +1,43 @@
-from libs.exchange_rates import populate_exchange_rates
-from libs.calculators.fifo import calculate_sales, calculate_remaining_purchases, calculate_dividends, calculate_dividends_tax, calculate_win_loss
-from libs.csv import export_statements, export_app8_part1, export_app5_table2, export_app8_part4_1
-from libs.xml import export_to_xml
-from libs.utils import merge_dict_of_dicts, merge_dict_of_lists, get_unsupported_activity_types
-import libs.parsers
-
-import sys
+from libs.parsers import supported_parsers
+from libs.utils import merge_dict_of_dicts, merge_dict_of_lists, get_unsupported_activity_types, scan_statement_files
+from libs import BNB_CONCURRENCY
+
 import os
+import csv
 import logging
-import importlib
-from pkgutil import iter_modules
 
 logger = logging.getLogger("process")
 
-supported_parsers = {}
+# Stage modules (exchange rates, calculators, exports) are imported by the stages using them, to keep startup fast
+
+AUTO_PARSER_NAME = "auto"
+
+
+def read_header(statement_file):
+    with open(statement_file.path, "r", encoding="utf-8-sig") as fd:
+        return next(csv.reader(fd, delimiter=","), [])
+
 
-if getattr(sys, "frozen", False):
-    import libs.parsers.revolut as revolut
-    import libs.parsers.trading212 as trading212
-    import libs.parsers.passfolio as passfolio
-    import libs.parsers.csv as csv
+def detect_parsers(statement_files):
+    # The generic csv parser accepts any file with its required columns, so it is tried last
+    parser_names = sorted(supported_parsers, key=lambda parser_name: parser_name == "csv")
 
-    supported_parsers = {"revolut": revolut.Parser, "trading212": trading212.Parser, "passfolio": passfolio.Parser, "csv": csv.Parser}
-else:
-    parser_modules = [mod.name for mod in iter_modules(libs.parsers.__path__, "libs.parsers.")]
-    for parser_module in parser_modules:
-        if not parser_module.endswith("parser"):
-            parser = importlib.import_module(parser_module).Parser
-            parser_name = parser_module.split(".")[-1]
-            supported_parsers[parser_name] = parser
+    parser_statement_files = {}
+    for statement_file in statement_files:
+        header_row = read_header(statement_file)
+        parser_name = next((parser_name for parser_name in parser_names if supported_parsers[parser_name].matches_header(header_row)), None)
+        if parser_name is None:
+            logger.warning(f"Unable to detect parser for statement file[{statement_file.path}], skipping it.")
+            continue
+
+        logger.debug(f"Detected parser[{parser_name}] for statement file[{statement_file.path}].")
+        parser_statement_files.setdefault(parser_name, []).append(statement_file)
+
+    if not parser_statement_files:
+        logger.error(f"No supported statement files found.")
+        raise SystemExit(1)
+
+    return parser_statement_files
 
 
 def for_each_parser(func, statements, filename=None, output_dir=None, **kwargs):
@@ -48,24 +57,107 @@ def for_each_parser(func, statements, filename=None, output_dir=None, **kwargs):
     return result
 
 
-def process(input_dir, output_dir, parser_names, use_bnb, in_currency=False):
-    logger.debug(f"Supported parsers: [{supported_parsers}]")
-
+def parse_statements(input_dir, parser_names, parse_workers=None, parse_cache_dir=None, deduplicate=False):
     parser_names = list(dict.fromkeys(parser_names))
+    if AUTO_PARSER_NAME in parser_names and len(parser_names) > 1:
+        logger.error(f"Parser[{AUTO_PARSER_NAME}] can't be combined with other parsers.")
+        raise SystemExit(1)
+
+    parse_cache = None
+    if parse_cache_dir is not None:
+        from libs.parse_cache import ParseCache
+
+        parse_cache = ParseCache(parse_cache_dir)
+
+    logger.info(f"Collecting statement files.")
+    statement_files = scan_statement_files(input_dir, "csv")
+
+    detected_statement_files = None
+    if parser_names == [AUTO_PARSER_NAME]:
+        detected_statement_files = detect_parsers(statement_files)
+        parser_names = list(detected_statement_files)
 
     logger.info(f"Parsing statement files with parsers: {parser_names}.")
     statements = {}
     for parser_name in parser_names:
         parser_input_dir = input_dir
-        if len(parser_names) > 1:
+        parser_statement_files = statement_files
+        if detected_statement_files is not None:
+            parser_statement_files = detected_statement_files[parser_name]
+        elif len(parser_names) > 1:
             parser_input_dir = os.path.join(parser_input_dir, parser_name)
+            parser_statement_files = [
+                statement_file for statement_file in statement_files if statement_file.path.startswith(parser_input_dir + os.sep)
+            ]
 
-        statements[parser_name] = supported_parsers[parser_name](parser_input_dir).parse()
+        statements[parser_name] = supported_parsers[parser_name](
+            parser_input_dir, parse_workers, parse_cache, parser_statement_files, deduplicate
+        ).parse()
 
         if not statements[parser_name]:
             logger.error(f"Not activities found with parser[{parser_name}]. Please, check the statement files.")
             raise SystemExit(1)
 
+    return statements
+
+
+def populate_statements_exchange_rates(statements, use_bnb, strict_rates=False, bnb_concurrency=BNB_CONCURRENCY, rates_cache_dir=None):
+    from libs.exchange_rates import populate_exchange_rates, get_currency_date_ranges, RateStore
+    from libs.rate_cache import RateCache
+
+    if use_bnb:
+        rate_store = RateStore.get_instance()
+        rate_store.concurrency = bnb_concurrency
+        if rates_cache_dir is not None and (rate_store.rate_cache is None or rate_store.rate_cache.cache_dir != rates_cache_dir):
+            rate_store.rate_cache = RateCache(rates_cache_dir)
+
+        currency_date_ranges = {}
+        for parser_statements in statements.values():
+            for currency, date_range in get_currency_date_ranges(parser_statements).items():
+                currency_date_ranges.setdefault(currency, []).append(date_range)
+
+        rate_store.fetch(currency_date_ranges)
+    for_each_parser(populate_exchange_rates, statements, use_bnb=use_bnb, strict=strict_rates)
+
+
+def process(
+    input_dir,
+    output_dir,
+    parser_names,
+    use_bnb,
+    in_currency=False,
+    strict_rates=False,
+    bnb_concurrency=BNB_CONCURRENCY,
+    rates_cache_dir=None,
+    parse_workers=None,
+    parse_cache_dir=None,
+    deduplicate=False,
+    statement_store_path=None,
+    load_statements=False,
+):
+    from libs.statement_store import StatementStore
+    from libs.calculators.fifo import calculate_sales, calculate_remaining_purchases, calculate_dividends, calculate_dividends_tax, calculate_win_loss
+    from libs.csv import export_statements, export_app8_part1, export_app5_table2, export_app8_part4_1
+    from libs.xml import export_to_xml
+
+    logger.debug(f"Supported parsers: {supported_parsers}")
+
+    if load_statements:
+        if statement_store_path is None:
+            logger.error(f"No statements database provided. Please, use -s argument.")
+            raise SystemExit(1)
+
+        logger.info(f"Loading statements from [{statement_store_path}].")
+        statement_store = StatementStore(statement_store_path, read_only=True)
+        statements = statement_store.load()
+        statement_store.close()
+
+        if not statements:
+            logger.error(f"No statements found in [{statement_store_path}].")
+            raise SystemExit(1)
+    else:
+        statements = parse_statements(input_dir, parser_names, parse_workers, parse_cache_dir, deduplicate)
+
     logger.info(f"Generating statements file.")
     for_each_parser(
         export_statements,
@@ -74,8 +166,14 @@ def process(input_dir, output_dir, parser_names, use_bnb, in_currency=False):
         output_dir=output_dir,
     )
 
-    logger.info(f"Populating exchange rates.")
-    for_each_parser(populate_exchange_rates, statements, use_bnb=use_bnb)
+    if not load_statements:
+        logger.info(f"Populating exchange rates.")
+        populate_statements_exchange_rates(statements, use_bnb, strict_rates, bnb_concurrency, rates_cache_dir)
+
+        if statement_store_path is not None:
+            statement_store = StatementStore(statement_store_path)
+            statement_store.store(statements)
+            statement_store.close()
 
     logger.info(f"Calculating dividends information.")
     dividends = for_each_parser(calculate_dividends, statements)
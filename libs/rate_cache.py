@@ -0,0 +1,66 @@
+import os
+import sqlite3
+import logging
+import decimal
+from datetime import datetime
+
+from libs.utils import merge_date_ranges
+
+logger = logging.getLogger("exchange_rates")
+
+decimal.getcontext().rounding = decimal.ROUND_HALF_UP
+
+RATE_CACHE_FILE_NAME = "exchange_rates.db"
+RATE_CACHE_SCHEMA_VERSION = 2
+
+
+class RateCache(object):
+    def __init__(self, cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.file_path = os.path.join(cache_dir, RATE_CACHE_FILE_NAME)
+        self.connection = sqlite3.connect(self.file_path)
+
+        schema_version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if schema_version != RATE_CACHE_SCHEMA_VERSION:
+            logger.debug(f"Initializing exchange rates cache[{self.file_path}] with schema version {RATE_CACHE_SCHEMA_VERSION}.")
+            with self.connection:
+                self.connection.execute("DROP TABLE IF EXISTS rates")
+                self.connection.execute("DROP TABLE IF EXISTS date_ranges")
+                self.connection.execute(
+                    "CREATE TABLE rates (currency TEXT NOT NULL, ordinal INTEGER NOT NULL, rate TEXT NOT NULL, PRIMARY KEY (currency, ordinal))"
+                )
+                self.connection.execute(
+                    "CREATE TABLE date_ranges (currency TEXT NOT NULL, first_ordinal INTEGER NOT NULL, last_ordinal INTEGER NOT NULL)"
+                )
+                self.connection.execute(f"PRAGMA user_version = {RATE_CACHE_SCHEMA_VERSION}")
+
+    def get_known_date_ranges(self, currency):
+        return self.connection.execute(
+            "SELECT first_ordinal, last_ordinal FROM date_ranges WHERE currency = ? ORDER BY first_ordinal",
+            (currency,),
+        ).fetchall()
+
+    def load(self, currency, first_ordinal, last_ordinal):
+        rows = self.connection.execute(
+            "SELECT ordinal, rate FROM rates WHERE currency = ? AND ordinal BETWEEN ? AND ? ORDER BY ordinal",
+            (currency, first_ordinal, last_ordinal),
+        )
+        return {datetime.fromordinal(ordinal): decimal.Decimal(rate) for ordinal, rate in rows}
+
+    def store(self, currency, exchange_rates, first_ordinal, last_ordinal):
+        known_date_ranges = self.get_known_date_ranges(currency) + [(first_ordinal, last_ordinal)]
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO rates (currency, ordinal, rate) VALUES (?, ?, ?)",
+                [(currency, date.toordinal(), str(rate)) for date, rate in exchange_rates.items()],
+            )
+            self.connection.execute("DELETE FROM date_ranges WHERE currency = ?", (currency,))
+            self.connection.executemany(
+                "INSERT INTO date_ranges (currency, first_ordinal, last_ordinal) VALUES (?, ?, ?)",
+                [(currency, first, last) for first, last in merge_date_ranges(known_date_ranges)],
+            )
+
+    def close(self):
+        self.connection.close()
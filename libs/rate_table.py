@@ -0,0 +1,269 @@
+import argparse
+import array
+import csv
+import mmap
+import os
+import struct
+import sys
+import logging
+import decimal
+from datetime import datetime
+
+from libs import BNB_DATE_FORMAT
+
+logger = logging.getLogger("exchange_rates")
+
+decimal.getcontext().rounding = decimal.ROUND_HALF_UP
+
+RATE_TABLE_MAGIC = b"NAPR"
+RATE_TABLE_VERSION = 1
+RATE_TABLE_PRECISION = 5
+RATE_TABLE_HEADER = struct.Struct("<4sHHII")
+CACHED_EXCHANGE_RATES_CURRENCY = "USD"
+RATE_TABLES_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "rate_tables")
+
+# Tables are sharded by currency and year, one file per shard.
+# Layout: header | int32 day ordinals | padding to 8 bytes | int64 fixed-point rates. All values are little-endian.
+
+
+def get_rates_offset(count):
+    offset = RATE_TABLE_HEADER.size + 4 * count
+    return offset + (-offset % 8)
+
+
+class FixedPointRates(object):
+    def __init__(self, values, precision):
+        self.values = values
+        self.precision = precision
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        return decimal.Decimal(self.values[index]).scaleb(-self.precision)
+
+
+class RateTable(object):
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+        magic, version, precision, count, _ = RATE_TABLE_HEADER.unpack_from(buffer)
+        if magic != RATE_TABLE_MAGIC or version != RATE_TABLE_VERSION:
+            raise ValueError(f"Unsupported exchange rates table format: [{magic}], version [{version}].")
+
+        rates_offset = get_rates_offset(count)
+        ordinals = memoryview(buffer)[RATE_TABLE_HEADER.size : RATE_TABLE_HEADER.size + 4 * count]
+        fixed_rates = memoryview(buffer)[rates_offset : rates_offset + 8 * count]
+
+        if sys.byteorder == "little":
+            self.ordinals = ordinals.cast("i")
+            fixed_rates = fixed_rates.cast("q")
+        else:
+            self.ordinals = array.array("i", ordinals)
+            self.ordinals.byteswap()
+            fixed_rates = array.array("q", fixed_rates)
+            fixed_rates.byteswap()
+
+        self.rates = FixedPointRates(fixed_rates, precision)
+
+    def __len__(self):
+        return len(self.ordinals)
+
+    def close(self):
+        # Memory views over the mapped buffer have to be released before the mapping can be closed
+        for view in [self.ordinals, self.rates.values]:
+            if isinstance(view, memoryview):
+                view.release()
+
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+
+def fits_precision(rate, precision):
+    value = decimal.Decimal(rate).scaleb(precision)
+    return value == value.to_integral_value()
+
+
+def to_fixed_point(rate, precision):
+    if not fits_precision(rate, precision):
+        raise ValueError(f"Exchange rate [{rate}] exceeds table precision of {precision} digits.")
+
+    return int(decimal.Decimal(rate).scaleb(precision))
+
+
+def build_rate_table(exchange_rates, file_path, precision=RATE_TABLE_PRECISION):
+    dates = sorted(exchange_rates.keys())
+
+    ordinals = array.array("i", [date.toordinal() for date in dates])
+    fixed_rates = array.array("q", [to_fixed_point(exchange_rates[date], precision) for date in dates])
+    if sys.byteorder != "little":
+        ordinals.byteswap()
+        fixed_rates.byteswap()
+
+    header = RATE_TABLE_HEADER.pack(RATE_TABLE_MAGIC, RATE_TABLE_VERSION, precision, len(dates), 0)
+    padding = b"\0" * (get_rates_offset(len(dates)) - len(header) - 4 * len(dates))
+
+    # Tables might be memory-mapped by the current process, so they are replaced instead of being overwritten
+    with open(file_path + ".tmp", "wb") as fd:
+        fd.write(header)
+        fd.write(ordinals.tobytes())
+        fd.write(padding)
+        fd.write(fixed_rates.tobytes())
+
+    os.replace(file_path + ".tmp", file_path)
+
+    logger.info(f"Exchange rates table with {len(dates)} entries written to [{file_path}].")
+
+
+def get_rate_table_path(year, currency=CACHED_EXCHANGE_RATES_CURRENCY, tables_dir=RATE_TABLES_DIR):
+    return os.path.join(tables_dir, f"{currency}-{year}.bin")
+
+
+def list_rate_table_years(currency=CACHED_EXCHANGE_RATES_CURRENCY, tables_dir=RATE_TABLES_DIR):
+    years = []
+    for file_name in os.listdir(tables_dir):
+        name, extension = os.path.splitext(file_name)
+        table_currency, _, year = name.partition("-")
+        if extension == ".bin" and table_currency == currency and year.isdigit():
+            years.append(int(year))
+
+    return sorted(years)
+
+
+def build_rate_tables(exchange_rates, tables_dir=RATE_TABLES_DIR, currency=CACHED_EXCHANGE_RATES_CURRENCY, precision=RATE_TABLE_PRECISION):
+    os.makedirs(tables_dir, exist_ok=True)
+
+    year_exchange_rates = {}
+    for date, exchange_rate in exchange_rates.items():
+        year_exchange_rates.setdefault(date.year, {})[date] = exchange_rate
+
+    # Mapped tables can't be replaced on Windows, so they are unloaded before being rebuilt
+    unload_rate_tables()
+
+    for year, exchange_rates in sorted(year_exchange_rates.items()):
+        build_rate_table(exchange_rates, get_rate_table_path(year, currency, tables_dir), precision)
+
+
+loaded_rate_tables = {}
+
+
+def load_rate_table(file_path):
+    if file_path not in loaded_rate_tables:
+        with open(file_path, "rb") as fd:
+            buffer = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+
+        loaded_rate_tables[file_path] = RateTable(buffer)
+
+    return loaded_rate_tables[file_path]
+
+
+def unload_rate_tables():
+    for rate_table in loaded_rate_tables.values():
+        rate_table.close()
+
+    loaded_rate_tables.clear()
+
+
+class MergedRateTable(object):
+    def __init__(self, tables, precision=RATE_TABLE_PRECISION):
+        self.ordinals = array.array("i")
+        fixed_rates = array.array("q")
+
+        for table in tables:
+            if table.rates.precision != precision:
+                raise ValueError(f"Unable to merge exchange rates tables with precision of {table.rates.precision} and {precision} digits.")
+
+            self.ordinals.extend(table.ordinals)
+            fixed_rates.extend(table.rates.values)
+
+        self.rates = FixedPointRates(fixed_rates, precision)
+
+    def __len__(self):
+        return len(self.ordinals)
+
+
+def load_rate_tables(first_year=None, last_year=None, currency=CACHED_EXCHANGE_RATES_CURRENCY, tables_dir=RATE_TABLES_DIR):
+    years = [
+        year
+        for year in list_rate_table_years(currency, tables_dir)
+        if (first_year is None or year >= first_year) and (last_year is None or year <= last_year)
+    ]
+    logger.debug(f"Loading cached [{currency}] exchange rates for years: {years}.")
+
+    return MergedRateTable([load_rate_table(get_rate_table_path(year, currency, tables_dir)) for year in years])
+
+
+def read_rate_tables(years, currency=CACHED_EXCHANGE_RATES_CURRENCY, tables_dir=RATE_TABLES_DIR):
+    exchange_rates = {}
+    for year in years:
+        file_path = get_rate_table_path(year, currency, tables_dir)
+        if not os.path.exists(file_path):
+            continue
+
+        # Tables are read into memory instead of being mapped, as they are about to be replaced
+        with open(file_path, "rb") as fd:
+            rate_table = RateTable(fd.read())
+
+        for index, ordinal in enumerate(rate_table.ordinals):
+            exchange_rates[datetime.fromordinal(ordinal)] = rate_table.rates[index]
+
+    return exchange_rates
+
+
+def forward_fill_exchange_rates(exchange_rates):
+    dates = sorted(exchange_rates.keys())
+
+    result = {}
+    exchange_rate = None
+    for ordinal in range(dates[0].toordinal(), dates[-1].toordinal() + 1):
+        date = datetime.fromordinal(ordinal)
+        exchange_rate = exchange_rates.get(date, exchange_rate)
+        result[date] = exchange_rate
+
+    return result
+
+
+def build_rate_tables_from_csv(file_paths, tables_dir=RATE_TABLES_DIR, currency=CACHED_EXCHANGE_RATES_CURRENCY, precision=RATE_TABLE_PRECISION):
+    from libs.bnb_client import read_exchange_rates
+
+    exchange_rates = {}
+    for file_path in file_paths:
+        logger.info(f"Reading BNB exchange rates file[{file_path}].")
+
+        with open(file_path, "r", encoding="utf-8", newline="") as fd:
+            for date, exchange_rate in read_exchange_rates(csv.reader(fd, delimiter=","), currency):
+                if not fits_precision(exchange_rate, precision):
+                    logger.error(
+                        f"Exchange rate [{exchange_rate}] for [{date.strftime(BNB_DATE_FORMAT)}] in file[{file_path}] "
+                        f"exceeds table precision of {precision} digits."
+                    )
+                    raise SystemExit(1)
+
+                if date in exchange_rates and exchange_rates[date] != exchange_rate:
+                    logger.warning(
+                        f"Conflicting exchange rates for [{date.strftime(BNB_DATE_FORMAT)}]: [{exchange_rates[date]}] and [{exchange_rate}]."
+                    )
+
+                exchange_rates[date] = exchange_rate
+
+    if not exchange_rates:
+        logger.error(f"No [{currency}] exchange rates found in files: {file_paths}.")
+        raise SystemExit(1)
+
+    # Neighbouring years are merged as well, so gaps at the boundaries of the new exchange rates are forward filled
+    years = range(min(exchange_rates.keys()).year - 1, max(exchange_rates.keys()).year + 2)
+    exchange_rates = {**read_rate_tables(years, currency, tables_dir), **exchange_rates}
+
+    build_rate_tables(forward_fill_exchange_rates(exchange_rates), tables_dir, currency, precision)
+
+
+if __name__ == "__main__":
+    from libs.cached_exchange_rates import load_exchange_rates
+
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s]: %(message)s")
+
+    parser = argparse.ArgumentParser(description="Rebuild the compact exchange rates tables from the cached exchange rates module.")
+    parser.add_argument("-o", dest="output_dir", help=f"Output tables directory. Default: {RATE_TABLES_DIR}.", default=RATE_TABLES_DIR)
+    parsed_args = parser.parse_args()
+
+    build_rate_tables(load_exchange_rates(), parsed_args.output_dir)
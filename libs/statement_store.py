@@ -0,0 +1,145 @@
+import os
+import sqlite3
+import logging
+import decimal
+import pathlib
+from datetime import datetime
+
+from libs.activity import Activity, ACTIVITY_FIELDS, EXCHANGE_RATE_FIELDS
+
+logger = logging.getLogger("process")
+
+decimal.getcontext().rounding = decimal.ROUND_HALF_UP
+
+STATEMENT_STORE_SCHEMA_VERSION = 1
+STATEMENT_STORE_COLUMNS = ["parser", "position"] + ACTIVITY_FIELDS + EXCHANGE_RATE_FIELDS
+STATEMENT_STORE_DATE_FIELDS = ["trade_date", "settle_date", "exchange_rate_date"]
+STATEMENT_STORE_DECIMAL_FIELDS = ["quantity", "price", "amount", "exchange_rate"]
+
+
+def to_column_value(field, value):
+    if value is None:
+        return None
+
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    if field in STATEMENT_STORE_DECIMAL_FIELDS:
+        return str(value)
+
+    return value
+
+
+def from_column_value(field, value):
+    if value is None:
+        return None
+
+    if field in STATEMENT_STORE_DATE_FIELDS:
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return value
+
+    if field in STATEMENT_STORE_DECIMAL_FIELDS:
+        return decimal.Decimal(value)
+
+    return value
+
+
+class StatementStore(object):
+    def __init__(self, file_path, read_only=False):
+        self.file_path = file_path
+
+        if read_only:
+            # Loading statements must not modify the database, so it is opened read-only and never initialized
+            try:
+                self.connection = sqlite3.connect(f"{pathlib.Path(os.path.abspath(file_path)).as_uri()}?mode=ro", uri=True)
+                schema_version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+            except sqlite3.Error as e:
+                logger.error(f"Unable to open statements database[{self.file_path}]: {e}")
+                raise SystemExit(1)
+
+            if schema_version != STATEMENT_STORE_SCHEMA_VERSION:
+                self.connection.close()
+                logger.error(
+                    f"Statements database[{self.file_path}] has schema version [{schema_version}], expected [{STATEMENT_STORE_SCHEMA_VERSION}]. "
+                    "Please, store the statements again with the `-s` argument."
+                )
+                raise SystemExit(1)
+
+            return
+
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.connection = sqlite3.connect(file_path)
+
+        schema_version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if schema_version != STATEMENT_STORE_SCHEMA_VERSION:
+            logger.debug(f"Initializing statements database[{self.file_path}] with schema version {STATEMENT_STORE_SCHEMA_VERSION}.")
+            with self.connection:
+                self.connection.execute("DROP TABLE IF EXISTS statements")
+                self.connection.execute(
+                    "CREATE TABLE statements ("
+                    "parser TEXT NOT NULL, position INTEGER NOT NULL, trade_date TEXT NOT NULL, settle_date TEXT, currency TEXT NOT NULL, "
+                    "activity_type TEXT NOT NULL, symbol TEXT, company TEXT, symbol_description TEXT, quantity TEXT, price TEXT, amount TEXT, "
+                    "exchange_rate_date TEXT, exchange_rate TEXT, PRIMARY KEY (parser, position))"
+                )
+                self.connection.execute("CREATE INDEX statements_symbol ON statements (symbol)")
+                self.connection.execute("CREATE INDEX statements_trade_date ON statements (trade_date)")
+                self.connection.execute("CREATE INDEX statements_activity_type ON statements (activity_type)")
+                self.connection.execute(f"PRAGMA user_version = {STATEMENT_STORE_SCHEMA_VERSION}")
+
+    def store(self, statements):
+        # The statements of previous runs are replaced as a whole, so loading never mixes in parsers that are no longer processed
+        with self.connection:
+            self.connection.execute("DELETE FROM statements")
+            for parser_name, parser_statements in statements.items():
+                self.connection.executemany(
+                    f"INSERT INTO statements ({', '.join(STATEMENT_STORE_COLUMNS)}) VALUES ({', '.join('?' * len(STATEMENT_STORE_COLUMNS))})",
+                    (
+                        [parser_name, position] + [to_column_value(field, statement.get(field)) for field in ACTIVITY_FIELDS + EXCHANGE_RATE_FIELDS]
+                        for position, statement in enumerate(parser_statements)
+                    ),
+                )
+
+        logger.info(f"Statements of parsers {list(statements)} stored in [{self.file_path}].")
+
+    def to_activity(self, row):
+        values = {field: from_column_value(field, value) for field, value in zip(STATEMENT_STORE_COLUMNS[2:], row)}
+
+        activity = Activity(*[values[field] for field in ACTIVITY_FIELDS])
+        for field in EXCHANGE_RATE_FIELDS:
+            if values[field] is not None:
+                activity[field] = values[field]
+
+        return activity
+
+    def query(self, parser_name=None, symbol=None, activity_type=None, first_date=None, last_date=None):
+        conditions = []
+        params = []
+        for condition, param in [
+            ("parser = ?", parser_name),
+            ("symbol = ?", symbol),
+            ("activity_type = ?", activity_type),
+            ("trade_date >= ?", to_column_value("trade_date", first_date)),
+            ("trade_date <= ?", to_column_value("trade_date", last_date)),
+        ]:
+            if param is not None:
+                conditions.append(condition)
+                params.append(param)
+
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self.connection.execute(f"SELECT {', '.join(STATEMENT_STORE_COLUMNS)} FROM statements{where} ORDER BY parser, position", params)
+        return [(row[0], self.to_activity(row[2:])) for row in rows]
+
+    def load(self):
+        statements = {}
+        for parser_name, activity in self.query():
+            statements.setdefault(parser_name, []).append(activity)
+
+        return statements
+
+    def close(self):
+        self.connection.close()
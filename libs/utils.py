@@ -1,5 +1,5 @@
-import glob
 import os
+from collections import namedtuple
 from datetime import datetime
 import logging
 
@@ -8,23 +8,31 @@ from libs import BNB_DATE_FORMAT
 logger = logging.getLogger("utils")
 
 
-def list_statement_files(dir, file_extension):
-    statement_files = []
+StatementFile = namedtuple("StatementFile", ["path", "size", "mtime"])
+
 
+def scan_statement_files(dir, file_extension):
     if not os.path.exists(dir):
         raise Exception(f"Statement directory[{dir}] doesn't exists.")
 
-    expresion = os.path.join(dir, "**", f"*.{file_extension}")
-    for file in glob.glob(expresion, recursive=True):
-        if not os.path.isfile(file):
-            continue
-        statement_files.append(file)
+    statement_files = []
+    dirs = [dir]
+    while dirs:
+        with os.scandir(dirs.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+
+                if entry.is_dir():
+                    dirs.append(entry.path)
+                elif entry.name.endswith(f".{file_extension}") and entry.is_file():
+                    stat = entry.stat()
+                    statement_files.append(StatementFile(entry.path, stat.st_size, stat.st_mtime))
 
-    return statement_files
+    return sorted(statement_files)
 
 
 def humanize_date(list_object):
-    result = []
     for elements in list_object:
         item = {}
         for key, value in elements.items():
@@ -34,8 +42,7 @@ def humanize_date(list_object):
 
             item[key] = value
 
-        result.append(item)
-    return result
+        yield item
 
 
 def get_parsers(supported_parsers, parsers, input_dir=None):
@@ -92,4 +99,16 @@ def merge_dict_of_lists(parser_statements):
     for _, statements in parser_statements.items():
         merged_list.extend(statements)
 
-    return merged_list
\ No newline at end of file
+    return merged_list
+
+
+def merge_date_ranges(date_ranges):
+    merged_ranges = []
+    for first_ordinal, last_ordinal in sorted(date_ranges):
+        if merged_ranges and first_ordinal <= merged_ranges[-1][1] + 1:
+            merged_ranges[-1] = (merged_ranges[-1][0], max(merged_ranges[-1][1], last_ordinal))
+            continue
+
+        merged_ranges.append((first_ordinal, last_ordinal))
+
+    return merged_ranges
@@ -1,7 +1,11 @@
 import argparse
 import logging
+import sys
 
-from libs.process import process, supported_parsers
+from libs import BNB_CONCURRENCY
+from libs.parsers import supported_parsers
+from libs.process import process, AUTO_PARSER_NAME
+from libs.rate_table import build_rate_tables_from_csv, RATE_TABLES_DIR, CACHED_EXCHANGE_RATES_CURRENCY
 
 logging.basicConfig(level=logging.INFO, format="[%(levelname)s]: %(message)s")
 
@@ -17,14 +21,84 @@ parser.add_argument(
     "-p",
     dest="parsers",
     action="append",
-    help=("Parsers to use for statement processing. You can use argument multiple times to use more than one parser. Default: revolut."),
-    choices=supported_parsers,
+    help=(
+        "Parsers to use for statement processing. You can use argument multiple times to use more than one parser. "
+        f"Use [{AUTO_PARSER_NAME}] to detect the parser of each statement file by its header. Default: revolut."
+    ),
+    choices=list(supported_parsers) + [AUTO_PARSER_NAME],
     required=False,
 )
 parser.add_argument("-b", dest="use_bnb", help="Use BNB online service as exchange rates source.", action="store_true")
+parser.add_argument(
+    "-l",
+    dest="strict_rates",
+    help="Use the last exchange rate published on or before the trade date, instead of the nearest published one.",
+    action="store_true",
+)
+parser.add_argument(
+    "-j",
+    dest="bnb_concurrency",
+    help=f"Maximum number of concurrent requests to BNB online service. Default: {BNB_CONCURRENCY}.",
+    type=int,
+    default=BNB_CONCURRENCY,
+)
+parser.add_argument(
+    "-r",
+    dest="rates_cache_dir",
+    help="Directory for caching exchange rates obtained from BNB online service. Only missing date ranges are requested on subsequent runs.",
+    required=False,
+)
+parser.add_argument(
+    "-w",
+    dest="parse_workers",
+    help="Number of processes used for parsing statement files. Default: 1.",
+    type=int,
+    required=False,
+)
+parser.add_argument(
+    "-k",
+    dest="parse_cache_dir",
+    help="Directory for caching parsed statement files. Only new or changed statement files are parsed on subsequent runs.",
+    required=False,
+)
+parser.add_argument(
+    "-d",
+    dest="deduplicate",
+    help="Drop activities already reported by another statement file, e.g. when monthly and yearly statements overlap.",
+    action="store_true",
+)
+parser.add_argument(
+    "-s",
+    dest="statement_store_path",
+    help="SQLite database file for storing parsed statements with populated exchange rates.",
+    required=False,
+)
+parser.add_argument(
+    "-x",
+    dest="load_statements",
+    help="Load statements from the statements database(-s) instead of parsing statement files.",
+    action="store_true",
+)
 parser.add_argument("-c", dest="in_currency", help="Show profit/loss in currency.", action="store_true")
 parser.add_argument("-v", dest="verbose", help="Enable verbose output.", action="store_true")
-parsed_args = parser.parse_args()
+
+rates_parser = argparse.ArgumentParser(prog="stocks.py rates", description="Cached exchange rates management.")
+rates_parser.add_argument("-v", dest="verbose", help="Enable verbose output.", action="store_true")
+rates_subparsers = rates_parser.add_subparsers(dest="rates_command", required=True)
+rates_build_parser = rates_subparsers.add_parser("build", help="Build cached exchange rates tables from BNB exchange rates files(in csv format).")
+rates_build_parser.add_argument("input_files", nargs="+", help="BNB exchange rates files, as exported by BNB online service.")
+rates_build_parser.add_argument("-o", dest="output_dir", help=f"Output tables directory. Default: {RATE_TABLES_DIR}.", default=RATE_TABLES_DIR)
+rates_build_parser.add_argument(
+    "-u",
+    dest="currency",
+    help=f"Currency of the exchange rates files. Default: {CACHED_EXCHANGE_RATES_CURRENCY}.",
+    default=CACHED_EXCHANGE_RATES_CURRENCY,
+)
+
+if sys.argv[1:2] == ["rates"]:
+    parsed_args = rates_parser.parse_args(sys.argv[2:])
+else:
+    parsed_args = parser.parse_args()
 
 if parsed_args.verbose:
     logging.getLogger("calculations").setLevel(level=logging.DEBUG)
@@ -34,6 +108,10 @@ if parsed_args.verbose:
 
 
 def main():
+    if getattr(parsed_args, "rates_command", None) == "build":
+        build_rate_tables_from_csv(parsed_args.input_files, parsed_args.output_dir, parsed_args.currency)
+        return
+
     parsers = parsed_args.parsers
     if parsers is None:
         parsers = ["revolut"]
@@ -44,8 +122,16 @@ def main():
         parsers,
         parsed_args.use_bnb,
         parsed_args.in_currency,
+        parsed_args.strict_rates,
+        parsed_args.bnb_concurrency,
+        parsed_args.rates_cache_dir,
+        parsed_args.parse_workers,
+        parsed_args.parse_cache_dir,
+        parsed_args.deduplicate,
+        parsed_args.statement_store_path,
+        parsed_args.load_statements,
     )
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
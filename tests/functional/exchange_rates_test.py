@@ -0,0 +1,332 @@
+import pytest
+import decimal
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from libs.exchange_rates import (
+    RateIndex,
+    RateCalendar,
+    RateResolver,
+    RateStore,
+    plan_date_ranges,
+    download_exchange_rates,
+    populate_exchange_rates,
+    get_rate_calendar,
+)
+from libs.rate_cache import RateCache
+from libs.bnb_client import BNBClient
+from libs.rate_table import build_rate_tables, build_rate_tables_from_csv, load_rate_tables, list_rate_table_years
+
+
+def get_bnb_rate(date, currency="USD"):
+    return decimal.Decimal(150000 + 10000 * (currency != "USD") + date.toordinal() % 1000).scaleb(-5)
+
+
+class BNBRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.connections.add(self.client_address)
+            server.active_requests += 1
+            server.max_active_requests = max(server.max_active_requests, server.active_requests)
+            fail = server.failures > 0
+            server.failures -= 1
+
+        time.sleep(0.05)
+
+        with server.lock:
+            server.active_requests -= 1
+
+        if fail:
+            self.send_response(500)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+        date = datetime(int(params["periodStartYear"]), int(params["periodStartMonths"]), int(params["periodStartDays"]))
+        last_date = datetime(int(params["periodEndYear"]), int(params["periodEndMonths"]), int(params["periodEndDays"]))
+
+        lines = ["Exchange rates of the Bulgarian lev,,,,", "Date,Currency,Code,Rate,Reverse rate"]
+        while date <= last_date:
+            if date.weekday() < 5:
+                lines.append(f"{date.strftime('%d.%m.%Y')},US Dollar,{params['valutes']}, {get_bnb_rate(date, params['valutes'])},0")
+            date += timedelta(days=1)
+
+        body = "\n".join(lines).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def bnb_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BNBRequestHandler)
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.active_requests = 0
+    server.max_active_requests = 0
+    server.failures = 0
+    server.connections = set()
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}/?"
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def exchange_rates():
+    return {
+        datetime(2021, 1, 4): decimal.Decimal("1.59256"),
+        datetime(2021, 1, 5): decimal.Decimal("1.59048"),
+        datetime(2021, 1, 8): decimal.Decimal("1.59870"),
+    }
+
+
+def test_rate_index_exact_date(exchange_rates):
+    rate_index = RateIndex.from_exchange_rates(exchange_rates)
+    assert rate_index.find(datetime(2021, 1, 5)) == (datetime(2021, 1, 5), decimal.Decimal("1.59048"))
+
+
+def test_rate_index_nearest_date(exchange_rates):
+    rate_index = RateIndex.from_exchange_rates(exchange_rates)
+    assert rate_index.find(datetime(2021, 1, 5, 13, 0, 0))[0] == datetime(2021, 1, 5)
+    assert rate_index.find(datetime(2021, 1, 7, 13, 0, 0))[0] == datetime(2021, 1, 8)
+    assert rate_index.find(datetime(2021, 1, 1))[0] == datetime(2021, 1, 4)
+    assert rate_index.find(datetime(2021, 2, 1))[0] == datetime(2021, 1, 8)
+
+
+def test_rate_index_strict_date(exchange_rates):
+    rate_index = RateIndex.from_exchange_rates(exchange_rates, strict=True)
+    assert rate_index.find(datetime(2021, 1, 7, 13, 0, 0))[0] == datetime(2021, 1, 5)
+    assert rate_index.find(datetime(2021, 1, 8, 9, 0, 0))[0] == datetime(2021, 1, 8)
+
+    with pytest.raises(SystemExit):
+        rate_index.find(datetime(2021, 1, 1))
+
+
+def test_rate_table_round_trip(tmp_path, exchange_rates):
+    exchange_rates = {**exchange_rates, datetime(2020, 12, 31): decimal.Decimal("1.60000")}
+    build_rate_tables(exchange_rates, str(tmp_path))
+    assert list_rate_table_years(tables_dir=str(tmp_path)) == [2020, 2021]
+
+    rate_table = load_rate_tables(tables_dir=str(tmp_path))
+    assert len(rate_table) == len(exchange_rates)
+    assert {datetime.fromordinal(ordinal): rate_table.rates[index] for index, ordinal in enumerate(rate_table.ordinals)} == exchange_rates
+
+    rate_table = load_rate_tables(2021, 2021, tables_dir=str(tmp_path))
+    assert [datetime.fromordinal(ordinal) for ordinal in rate_table.ordinals] == sorted(date for date in exchange_rates if date.year == 2021)
+
+
+def test_plan_date_ranges():
+    assert plan_date_ranges([(10, 20), (15, 30), (31, 40), (50, 60)]) == [(10, 40), (50, 60)]
+    assert plan_date_ranges([(10, 40), (50, 60)], [(5, 12), (20, 25), (55, 70)]) == [(13, 19), (26, 40), (50, 54)]
+    assert plan_date_ranges([(10, 20)], [(0, 30)]) == []
+
+
+def test_download_exchange_rates_concurrently(bnb_server):
+    exchange_rates = download_exchange_rates(datetime(2016, 1, 1), datetime(2020, 12, 31), concurrency=3, base_url=bnb_server.base_url)
+
+    assert bnb_server.requests == 20
+    assert bnb_server.max_active_requests <= 3
+    assert list(exchange_rates.keys()) == sorted(exchange_rates.keys())
+    assert all(rate == get_bnb_rate(date) for date, rate in exchange_rates.items())
+    assert min(exchange_rates.keys()) == datetime(2016, 1, 1)
+    assert max(exchange_rates.keys()) >= datetime(2020, 12, 31)
+
+
+def test_download_exchange_rates_retries(bnb_server):
+    bnb_server.failures = 2
+    exchange_rates = download_exchange_rates(
+        datetime(2021, 1, 1), datetime(2021, 1, 31), concurrency=1, base_url=bnb_server.base_url, retry_backoff=0
+    )
+
+    assert bnb_server.requests == 3
+    assert exchange_rates[datetime(2021, 1, 4)] == get_bnb_rate(datetime(2021, 1, 4))
+
+
+def test_rate_store_cache_gaps(tmp_path, bnb_server):
+    rate_store = RateStore()
+    rate_store.base_url = bnb_server.base_url
+    rate_store.rate_cache = RateCache(str(tmp_path))
+    rate_store.fetch({"USD": [(datetime(2020, 3, 1), datetime(2020, 6, 30))]})
+    first_run_requests = bnb_server.requests
+
+    rate_store = RateStore()
+    rate_store.base_url = bnb_server.base_url
+    rate_store.rate_cache = RateCache(str(tmp_path))
+    rate_store.fetch({"USD": [(datetime(2020, 3, 1), datetime(2020, 6, 30))]})
+    assert bnb_server.requests == first_run_requests
+
+    rate_store.fetch({"USD": [(datetime(2020, 3, 1), datetime(2020, 7, 31))]})
+    assert bnb_server.requests == first_run_requests + 1
+
+    rate_index = rate_store.get_rate_index("USD", datetime(2020, 3, 1), datetime(2020, 7, 31), True, strict=True)
+    assert rate_index.find(datetime(2020, 7, 31, 10, 0, 0)) == (datetime(2020, 7, 31), get_bnb_rate(datetime(2020, 7, 31)))
+    assert rate_index.find(datetime(2020, 3, 1)) == (datetime(2020, 2, 28), get_bnb_rate(datetime(2020, 2, 28)))
+
+
+def test_populate_exchange_rates_by_currency(bnb_server, monkeypatch):
+    rate_store = RateStore()
+    rate_store.base_url = bnb_server.base_url
+    monkeypatch.setattr(RateStore, "instance", rate_store)
+
+    statements = [
+        {"trade_date": datetime(2021, 3, 2, 10, 0, 0), "currency": "USD"},
+        {"trade_date": datetime(2021, 3, 3, 10, 0, 0), "currency": "GBP"},
+        {"trade_date": datetime(2021, 3, 6, 10, 0, 0), "currency": "EUR"},
+    ]
+    populate_exchange_rates(statements, True, strict=True)
+
+    assert statements[0]["exchange_rate"] == get_bnb_rate(datetime(2021, 3, 2))
+    assert statements[1]["exchange_rate"] == get_bnb_rate(datetime(2021, 3, 3), "GBP")
+    assert statements[2]["exchange_rate"] == decimal.Decimal("1.95583")
+    assert statements[2]["exchange_rate_date"] == datetime(2021, 3, 6)
+
+
+def test_get_rate_calendar_cached(monkeypatch):
+    monkeypatch.setattr(RateStore, "instance", RateStore())
+
+    rate_calendar = get_rate_calendar("USD", first_date=datetime(2021, 1, 1), last_date=datetime(2021, 1, 31), strict=True)
+    rate_table = load_rate_tables(2021, 2021)
+    index = list(rate_table.ordinals).index(datetime(2021, 1, 4).toordinal())
+    assert rate_calendar.find(datetime(2021, 1, 4, 10, 0, 0)) == (datetime(2021, 1, 4), rate_table.rates[index])
+
+    assert get_rate_calendar("EUR").find(datetime(2021, 1, 4, 10, 0, 0)) == (datetime(2021, 1, 4), decimal.Decimal("1.95583"))
+
+
+def test_get_rate_calendar_bnb(bnb_server, monkeypatch):
+    rate_store = RateStore()
+    rate_store.base_url = bnb_server.base_url
+    monkeypatch.setattr(RateStore, "instance", rate_store)
+
+    rate_calendar = get_rate_calendar("GBP", use_bnb=True, first_date=datetime(2021, 3, 1), last_date=datetime(2021, 3, 31), strict=True)
+    assert rate_calendar.find(datetime(2021, 3, 3, 10, 0, 0)) == (datetime(2021, 3, 3), get_bnb_rate(datetime(2021, 3, 3), "GBP"))
+
+    # Without a date range only the exchange rates fetched so far are available
+    requests = bnb_server.requests
+    assert get_rate_calendar("GBP", use_bnb=True).find(datetime(2021, 3, 3, 10, 0, 0)) == rate_calendar.find(datetime(2021, 3, 3, 10, 0, 0))
+    assert bnb_server.requests == requests
+
+    with pytest.raises(SystemExit):
+        get_rate_calendar("USD", use_bnb=True)
+
+
+def test_rate_calendar_matches_rate_index(exchange_rates):
+    rate_index = RateIndex.from_exchange_rates(exchange_rates)
+    rate_calendar = RateCalendar(rate_index.ordinals, rate_index.rates)
+    assert list(rate_calendar.indexes) == [0, 1, 1, 1, 2]
+
+    search_dates = [datetime(2021, 1, 1), datetime(2021, 1, 4), datetime(2021, 1, 6, 11, 0, 0), datetime(2021, 1, 7, 13, 0, 0), datetime(2021, 2, 1)]
+    for strict in [False, True]:
+        if strict:
+            search_dates = search_dates[1:]
+
+        rate_index.strict = strict
+        assert [rate_calendar.with_strict(strict).find(search_date) for search_date in search_dates] == [
+            rate_index.find(search_date) for search_date in search_dates
+        ]
+
+
+def test_bnb_client_keep_alive(bnb_server):
+    bnb_client = BNBClient(bnb_server.base_url)
+
+    for month in range(1, 7):
+        exchange_rates = bnb_client.request_exchange_rates(datetime(2021, month, 1), datetime(2021, month, 28), "USD")
+        assert exchange_rates
+        assert all(rate == get_bnb_rate(date) for date, rate in exchange_rates.items())
+
+    bnb_client.close()
+
+    assert bnb_client.requests == 6
+    assert bnb_client.bytes_read > 0
+    assert len(bnb_server.connections) == 1
+
+
+def test_rate_resolver_memo(exchange_rates):
+    rate_resolver = RateResolver({"USD": RateIndex.from_exchange_rates(exchange_rates)})
+
+    assert rate_resolver.resolve("USD", datetime(2021, 1, 4))[0] == datetime(2021, 1, 4)
+    assert rate_resolver.resolve("USD", datetime(2021, 1, 7, 10, 0, 0))[0] == datetime(2021, 1, 8)
+    assert rate_resolver.resolve("USD", datetime(2021, 1, 7, 11, 0, 0))[0] == datetime(2021, 1, 8)
+    assert rate_resolver.resolve("USD", datetime(2021, 1, 7, 2, 0, 0))[0] == datetime(2021, 1, 8)
+    assert rate_resolver.resolve("USD", datetime(2021, 1, 6, 1, 0, 0))[0] == datetime(2021, 1, 5)
+
+    assert rate_resolver.counters == {"exact": 1, "memo": 2, "fallback": 2}
+
+
+def test_build_rate_tables_from_csv(tmp_path):
+    first_file = tmp_path / "first.csv"
+    first_file.write_text(
+        "Exchange rates,,,,\nDate,Currency,Code,Rate,Reverse rate\n30.12.2020,US Dollar,USD, 1.59000,0\n31.12.2020,US Dollar,USD, 1.59500,0\n"
+    )
+    second_file = tmp_path / "second.csv"
+    second_file.write_text(
+        "Exchange rates,,,,\nDate,Currency,Code,Rate,Reverse rate\n31.12.2020,US Dollar,USD, 1.59500,0\n04.01.2021,US Dollar,USD, 1.59062,0\n"
+    )
+
+    build_rate_tables_from_csv([str(first_file), str(second_file)], str(tmp_path / "tables"))
+
+    rate_table = load_rate_tables(tables_dir=str(tmp_path / "tables"))
+    assert [datetime.fromordinal(ordinal) for ordinal in rate_table.ordinals] == [datetime(2020, 12, 30) + timedelta(days=day) for day in range(6)]
+    assert [rate_table.rates[index] for index in range(len(rate_table))] == [
+        decimal.Decimal(rate) for rate in ["1.59", "1.595", "1.595", "1.595", "1.595", "1.59062"]
+    ]
+
+
+def test_build_rate_tables_from_csv_merge(tmp_path):
+    first_file = tmp_path / "first.csv"
+    first_file.write_text(
+        "Exchange rates,,,,\nDate,Currency,Code,Rate,Reverse rate\n30.12.2020,US Dollar,USD, 1.59000,0\n31.12.2020,US Dollar,USD, 1.59500,0\n"
+    )
+    second_file = tmp_path / "second.csv"
+    second_file.write_text(
+        "Exchange rates,,,,\nDate,Currency,Code,Rate,Reverse rate\n04.01.2021,Euro,EUR, 1.95583,0\n04.01.2021,US Dollar,USD, 1.59062,0\n"
+    )
+
+    build_rate_tables_from_csv([str(first_file)], str(tmp_path / "tables"))
+    assert len(load_rate_tables(tables_dir=str(tmp_path / "tables"))) == 2
+
+    # Existing tables are mapped by the previous load, they have to be merged and replaced
+    build_rate_tables_from_csv([str(second_file)], str(tmp_path / "tables"))
+
+    assert list_rate_table_years(tables_dir=str(tmp_path / "tables")) == [2020, 2021]
+    assert list_rate_table_years("EUR", str(tmp_path / "tables")) == []
+
+    rate_table = load_rate_tables(tables_dir=str(tmp_path / "tables"))
+    assert [datetime.fromordinal(ordinal) for ordinal in rate_table.ordinals] == [datetime(2020, 12, 30) + timedelta(days=day) for day in range(6)]
+    assert [rate_table.rates[index] for index in range(len(rate_table))] == [
+        decimal.Decimal(rate) for rate in ["1.59", "1.595", "1.595", "1.595", "1.595", "1.59062"]
+    ]
+
+
+def test_cached_rate_calendar_year_boundary():
+    last_date = datetime(2019, 12, 31, 18, 0, 0)
+    rate_index = RateStore().get_rate_index("USD", datetime(2019, 12, 1), last_date, use_bnb=False)
+
+    assert rate_index.find(last_date)[0] == datetime(2020, 1, 1)
+
+
+def test_build_rate_tables_from_csv_precision(tmp_path, caplog):
+    rates_file = tmp_path / "rates.csv"
+    rates_file.write_text("Exchange rates,,,,\nDate,Currency,Code,Rate,Reverse rate\n04.01.2021,US Dollar,USD, 1.590625,0\n")
+
+    with pytest.raises(SystemExit):
+        build_rate_tables_from_csv([str(rates_file)], str(tmp_path / "tables"))
+
+    assert caplog.messages[-1] == f"Exchange rate [1.590625] for [04.01.2021] in file[{rates_file}] exceeds table precision of 5 digits."
+    assert not (tmp_path / "tables").exists()
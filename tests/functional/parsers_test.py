@@ -0,0 +1,310 @@
+import pytest
+
+import decimal
+import logging
+import os
+import pickle
+import re
+import subprocess
+import sys
+import types
+from datetime import datetime
+
+from libs.activity import Activity
+from libs.dates import get_date_parser, get_iso_date_parser, to_iso_format
+from libs.parse_cache import ParseCache
+from libs.process import detect_parsers
+from libs.utils import scan_statement_files
+import libs.parsers.csv as csv_parser
+import libs.parsers.passfolio as passfolio
+import libs.parsers.revolut as revolut
+import libs.parsers.trading212 as trading212
+
+REVOLUT_HEADER = "Date,Ticker,Type,Quantity,Price per share,Total Amount,Currency,FX Rate"
+CSV_HEADER = "Trade Date,Activity Type,Company,Symbol,Quantity,Price,Amount,Symbol Description"
+PASSFOLIO_ORDERS_HEADER = "orderId,enteredAt,executedAt,status,side,type,symbol,filledQuantity,quantity,amount,price,service,feesUSD"
+PASSFOLIO_DIVIDENDS_HEADER = (
+    "receivedAt,reinvested,reinvestedAt,reinvestedAmount,isAdjustment,amount,amountPerShare,symbol,type,taxCode,description,taxAmount,taxRate"
+)
+TRADING212_HEADER = "Action,Time,ISIN,Ticker,Name,No. of shares,Price / share,Currency (Price / share),Exchange rate,Result (EUR),Total (EUR)"
+
+
+def write_statement_file(file_path, header, rows):
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    file_path.write_text("\n".join([header] + rows) + "\n")
+
+
+@pytest.fixture
+def revolut_input_dir(tmp_path):
+    input_dir = tmp_path / "revolut"
+    write_statement_file(
+        input_dir / "2.csv",
+        REVOLUT_HEADER,
+        [
+            "20/01/2021 15:30:00,TSLA,SSP,5,100,0,USD,1.0",
+            "01/02/2021 15:30:00,AAPL,BUY,2,130,260,USD,1.0",
+            "15/02/2021 15:30:00,AAPL,SELL,1,135,135,USD,1.0",
+        ],
+    )
+    write_statement_file(
+        input_dir / "1.csv",
+        REVOLUT_HEADER,
+        [
+            "04/01/2021 15:30:00,AAPL,BUY,1,128,128,USD,1.0",
+            "05/01/2021 15:30:00,AAPL,DIV,,,0.5,USD,1.0",
+            "05/01/2021 15:30:00,CASH,CDEP,,,100,USD,1.0",
+        ],
+    )
+    return str(input_dir)
+
+
+def test_revolut_parser_ordering(revolut_input_dir):
+    statements = revolut.Parser(revolut_input_dir).parse()
+
+    assert [(statement["trade_date"].day, statement["trade_date"].month, statement["activity_type"]) for statement in statements] == [
+        (4, 1, "BUY"),
+        (5, 1, "DIV"),
+        (20, 1, "SSP"),
+        (1, 2, "BUY"),
+        (15, 2, "SELL"),
+    ]
+
+
+def test_parallel_parsing(revolut_input_dir, tmp_path):
+    assert revolut.Parser(revolut_input_dir, workers=2).parse() == revolut.Parser(revolut_input_dir).parse()
+
+    input_dir = tmp_path / "trading212"
+    for month in range(1, 5):
+        write_statement_file(
+            input_dir / f"{month}.csv",
+            TRADING212_HEADER,
+            [f'Market buy,2021-0{month}-0{day} 15:30:00,US0378331005,AAPL,Apple,1,130,USD,1.2,0,"1,08.33"' for day in range(1, 4)],
+        )
+
+    assert trading212.Parser(str(input_dir), workers=2).parse() == trading212.Parser(str(input_dir)).parse()
+
+
+def test_iter_activities(revolut_input_dir, tmp_path):
+    activities = revolut.Parser(revolut_input_dir).iter_activities()
+    assert isinstance(activities, types.GeneratorType)
+    assert list(activities) == revolut.Parser(revolut_input_dir).parse()
+
+    input_dir = tmp_path / "csv"
+    write_statement_file(input_dir / "1.csv", CSV_HEADER, ["04.01.2021,BUY,Apple,AAPL,1,128,128,Apple Inc."])
+    write_statement_file(input_dir / "2.csv", CSV_HEADER, ["05.01.2021,SELL,Apple,AAPL,1,130,130,Apple Inc."])
+
+    activities = csv_parser.Parser(str(input_dir)).iter_activities()
+    first_activity = next(activities)
+    assert sorted([first_activity["activity_type"]] + [activity["activity_type"] for activity in activities]) == ["BUY", "SELL"]
+
+
+def test_activity_record(revolut_input_dir):
+    activity = revolut.Parser(revolut_input_dir).parse()[0]
+    assert isinstance(activity, Activity)
+    assert activity["symbol"] == activity.symbol == "AAPL"
+    assert "exchange_rate" not in activity
+    assert activity.get("exchange_rate") is None
+
+    activity["exchange_rate"] = 1
+    assert activity.keys()[-1] == "exchange_rate"
+    assert pickle.loads(pickle.dumps(activity)) == activity
+
+    with pytest.raises(KeyError):
+        activity["unknown"] = 1
+
+
+@pytest.mark.parametrize(
+    "date_format,date_string",
+    [
+        ("%d/%m/%Y %H:%M:%S", "05/01/2021 15:30:00"),
+        ("%d/%m/%Y %H:%M:%S", "5/1/2021 15:30:00"),
+        ("%Y-%m-%d %H:%M:%S", "2021-01-05 15:30:00"),
+        ("%d.%m.%Y", "05.01.2021"),
+        ("%b %d %Y", "Jan 05 2021"),
+    ],
+)
+def test_date_parser(date_format, date_string):
+    assert get_date_parser(date_format)(date_string) == datetime.strptime(date_string, date_format)
+
+
+def test_date_parser_errors():
+    with pytest.raises(ValueError):
+        get_date_parser("%d/%m/%Y %H:%M:%S")("05/13/2021 15:30:00")
+
+    with pytest.raises(ValueError):
+        get_date_parser("%d.%m.%Y")("O5.01.2021")
+
+
+@pytest.mark.parametrize("date_string", ["2021-01-05T15:30:00.123Z", "2021-01-05T15:30:00.1+02:00", "2021-01-05T15:30:00.123456+0000"])
+def test_iso_date_parser(date_string):
+    date_format = "%Y-%m-%dT%H:%M:%S.%f%z"
+    assert get_iso_date_parser(date_format, naive=True)(date_string) == datetime.strptime(date_string, date_format).replace(tzinfo=None)
+    # Normalized to the only layout accepted by datetime.fromisoformat of Python < 3.11
+    assert re.fullmatch(r"[0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9]{2}:[0-9]{2}:[0-9]{2}\.[0-9]{6}[+-][0-9]{2}:[0-9]{2}", to_iso_format(date_string))
+
+
+def test_csv_parser_date_format_detection(tmp_path, caplog):
+    input_dir = tmp_path / "csv"
+    write_statement_file(
+        input_dir / "1.csv",
+        CSV_HEADER,
+        [
+            "2021/01/04,BUY,Apple,AAPL,1,128,128,Apple Inc.",
+            "2021/01/05,BUY,Apple,AAPL,1,129,129,Apple Inc.",
+            "06.01.2021,SELL,Apple,AAPL,1,130,130,Apple Inc.",
+        ],
+    )
+
+    with caplog.at_level(logging.INFO, logger="parsers"):
+        statements = csv_parser.Parser(str(input_dir)).parse()
+
+    assert [statement["trade_date"].day for statement in statements] == [4, 5, 6]
+    assert "Detected statement date format[%Y/%m/%d]." in caplog.messages
+
+
+def test_parse_cache(revolut_input_dir, tmp_path, monkeypatch):
+    parse_cache = ParseCache(str(tmp_path / "parse_cache"))
+    statements = revolut.Parser(revolut_input_dir).parse()
+
+    parsed_statement_files = []
+    parse_statement_file = revolut.Parser.parse_statement_file
+
+    def counting_parse_statement_file(self, statement_file):
+        parsed_statement_files.append(os.path.basename(statement_file))
+        return parse_statement_file(self, statement_file)
+
+    monkeypatch.setattr(revolut.Parser, "parse_statement_file", counting_parse_statement_file)
+
+    assert revolut.Parser(revolut_input_dir, parse_cache=parse_cache).parse() == statements
+    assert sorted(parsed_statement_files) == ["1.csv", "2.csv"]
+
+    parsed_statement_files.clear()
+    assert revolut.Parser(revolut_input_dir, parse_cache=parse_cache).parse() == statements
+    assert parsed_statement_files == []
+
+    write_statement_file(tmp_path / "revolut" / "3.csv", REVOLUT_HEADER, ["01/03/2021 15:30:00,AAPL,SELL,1,140,140,USD,1.0"])
+    statements = revolut.Parser(revolut_input_dir, parse_cache=parse_cache).parse()
+    assert parsed_statement_files == ["3.csv"]
+    assert statements[-1]["trade_date"].month == 3
+
+
+def test_overlapping_statement_files_ordering(tmp_path):
+    input_dir = tmp_path / "trading212"
+    write_statement_file(
+        input_dir / "1.csv",
+        TRADING212_HEADER,
+        [
+            "Market buy,2021-01-04 15:30:00,US0378331005,AAPL,Apple,1,128,USD,1.2,0,106.67",
+            "Market sell,2021-01-20 15:30:00,US0378331005,AAPL,Apple,1,135,USD,1.2,0,112.5",
+            "Market buy,2021-01-10 15:30:00,US0378331005,AAPL,Apple,1,130,USD,1.2,0,108.33",
+        ],
+    )
+    write_statement_file(
+        input_dir / "2.csv",
+        TRADING212_HEADER,
+        [
+            "Market buy,2021-01-05 15:30:00,US0378331005,AAPL,Apple,1,129,USD,1.2,0,107.5",
+            "Market buy,2021-01-10 15:30:00,US0378331005,AAPL,Apple,2,130,USD,1.2,0,216.67",
+        ],
+    )
+
+    statements = trading212.Parser(str(input_dir)).parse()
+    assert [(statement["trade_date"].day, statement["quantity"]) for statement in statements] == [(4, 1), (5, 1), (10, 1), (10, 2), (20, 1)]
+
+
+def test_scan_statement_files(tmp_path):
+    write_statement_file(tmp_path / "revolut" / "2.csv", REVOLUT_HEADER, [])
+    write_statement_file(tmp_path / "revolut" / "2021" / "1.csv", REVOLUT_HEADER, [])
+    write_statement_file(tmp_path / "trading212" / "1.csv", TRADING212_HEADER, [])
+    write_statement_file(tmp_path / "revolut" / ".hidden" / "1.csv", REVOLUT_HEADER, [])
+    write_statement_file(tmp_path / "revolut" / "1.pdf", REVOLUT_HEADER, [])
+
+    statement_files = scan_statement_files(str(tmp_path), "csv")
+
+    assert [os.path.relpath(statement_file.path, tmp_path) for statement_file in statement_files] == [
+        os.path.join("revolut", "2.csv"),
+        os.path.join("revolut", "2021", "1.csv"),
+        os.path.join("trading212", "1.csv"),
+    ]
+    assert statement_files[0].size == len(REVOLUT_HEADER) + 1
+
+
+def test_passfolio_statement_type_detection(tmp_path):
+    input_dir = tmp_path / "passfolio"
+    write_statement_file(
+        input_dir / "1.csv",
+        PASSFOLIO_ORDERS_HEADER,
+        [
+            '1,2021-01-04T15:30:00.000Z,2021-01-04T15:30:01.000Z,FILLED,BUY,MARKET,AAPL,2,2,"1,256.00",128,,0',
+            "2,2021-01-05T15:30:00.000Z,,CANCELED,SELL,MARKET,AAPL,0,1,130,130,,0",
+        ],
+    )
+    write_statement_file(
+        input_dir / "2.csv", PASSFOLIO_DIVIDENDS_HEADER, ["2021-02-01T12:00:00.000Z,false,,,false,0.5,0.25,AAPL,DIV,,Apple dividend,0,0"]
+    )
+
+    statements = passfolio.Parser(str(input_dir)).parse()
+
+    assert [(statement["activity_type"], statement["amount"]) for statement in statements] == [
+        ("BUY", decimal.Decimal("1256.00")),
+        ("DIV", decimal.Decimal("0.5")),
+    ]
+    assert statements[1]["quantity"] == decimal.Decimal("0.125")
+
+
+def test_detect_parsers(tmp_path):
+    write_statement_file(tmp_path / "a.csv", REVOLUT_HEADER, [])
+    write_statement_file(tmp_path / "b.csv", TRADING212_HEADER, [])
+    write_statement_file(tmp_path / "c.csv", PASSFOLIO_ORDERS_HEADER, [])
+    write_statement_file(tmp_path / "d.csv", PASSFOLIO_DIVIDENDS_HEADER, [])
+    write_statement_file(tmp_path / "e.csv", CSV_HEADER, [])
+    write_statement_file(tmp_path / "f.csv", "Unknown,Header", [])
+
+    parser_statement_files = detect_parsers(scan_statement_files(str(tmp_path), "csv"))
+
+    assert {
+        parser_name: [os.path.basename(statement_file.path) for statement_file in statement_files]
+        for parser_name, statement_files in parser_statement_files.items()
+    } == {"revolut": ["a.csv"], "trading212": ["b.csv"], "passfolio": ["c.csv", "d.csv"], "csv": ["e.csv"]}
+
+
+def test_statement_file_with_bom(tmp_path):
+    input_dir = tmp_path / "trading212"
+    write_statement_file(
+        input_dir / "1.csv", "\ufeff" + TRADING212_HEADER, ["Market buy,2021-01-04 15:30:00,US0378331005,AAPL,Apple,1,128,USD,1.2,0,106.67"]
+    )
+
+    assert list(detect_parsers(scan_statement_files(str(input_dir), "csv"))) == ["trading212"]
+    assert [statement["activity_type"] for statement in trading212.Parser(str(input_dir)).parse()] == ["BUY"]
+
+
+def test_deduplication(tmp_path, caplog):
+    input_dir = tmp_path / "trading212"
+    buy = "Market buy,2021-01-04 15:30:00,US0378331005,AAPL,Apple,1,128,USD,1.2,0,106.67"
+    sell = "Market sell,2021-02-01 15:30:00,US0378331005,AAPL,Apple,1,135,USD,1.2,0,112.5"
+    write_statement_file(input_dir / "2021-01.csv", TRADING212_HEADER, [buy, buy])
+    write_statement_file(input_dir / "2021.csv", TRADING212_HEADER, [buy, buy, buy, sell])
+    write_statement_file(input_dir / "2021-02.csv", TRADING212_HEADER, [sell])
+
+    assert len(trading212.Parser(str(input_dir)).parse()) == 7
+
+    with caplog.at_level(logging.WARNING, logger="parsers"):
+        statements = trading212.Parser(str(input_dir), deduplicate=True).parse()
+
+    assert [statement["activity_type"] for statement in statements] == ["BUY", "BUY", "BUY", "SELL"]
+    assert caplog.messages == [f"Dropped 3 duplicate activities from statement file[{input_dir / '2021.csv'}]."]
+
+
+def test_lazy_parser_registry():
+    script = """
+import sys
+from libs.parsers import supported_parsers
+import stocks
+
+assert sorted(supported_parsers) == ["csv", "passfolio", "revolut", "trading212"]
+assert not [module for module in sys.modules if module.startswith(("libs.parsers.", "libs.exchange_rates", "numpy", "lxml", "dateutil"))]
+
+supported_parsers["revolut"]
+assert "libs.parsers.revolut" in sys.modules and "libs.parsers.csv" not in sys.modules
+"""
+    subprocess.run([sys.executable, "-c", script, "-o", "output"], check=True, cwd=os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
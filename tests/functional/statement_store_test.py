@@ -0,0 +1,70 @@
+import pytest
+
+import decimal
+import sqlite3
+from datetime import datetime
+
+from libs.activity import Activity
+from libs.statement_store import StatementStore
+
+
+def test_statement_store(tmp_path):
+    buy = Activity(
+        datetime(2021, 1, 4, 15, 30),
+        "-",
+        "USD",
+        "BUY",
+        "AAPL",
+        "Apple",
+        "Apple US0378331005",
+        decimal.Decimal("1"),
+        decimal.Decimal("128.5"),
+        decimal.Decimal("128.5"),
+    )
+    buy["exchange_rate_date"] = datetime(2021, 1, 4)
+    buy["exchange_rate"] = decimal.Decimal("1.59062")
+    dividend = Activity(datetime(2021, 2, 1), datetime(2021, 2, 1), "USD", "DIV", "MSFT", "MSFT", "MSFT", None, None, decimal.Decimal("0.56"))
+    sell = Activity(
+        datetime(2021, 2, 15, 15, 30),
+        "-",
+        "USD",
+        "SELL",
+        "AAPL",
+        "Apple",
+        "Apple US0378331005",
+        decimal.Decimal("1"),
+        decimal.Decimal("135"),
+        decimal.Decimal("135"),
+    )
+
+    statement_store = StatementStore(str(tmp_path / "statements.db"))
+    statement_store.store({"trading212": [buy, sell], "revolut": [dividend]})
+    statement_store.store({"trading212": [buy, sell]})
+    statement_store.close()
+
+    statement_store = StatementStore(str(tmp_path / "statements.db"), read_only=True)
+    assert statement_store.load() == {"trading212": [buy, sell]}
+    assert [activity for _, activity in statement_store.query(symbol="AAPL", first_date=datetime(2021, 2, 1))] == [sell]
+    assert [parser_name for parser_name, _ in statement_store.query(activity_type="SELL")] == ["trading212"]
+    # Stored statements replace the ones of the previous run, including parsers that are not processed anymore
+    assert statement_store.query(activity_type="DIV") == []
+
+
+def test_statement_store_read_only(tmp_path):
+    with pytest.raises(SystemExit):
+        StatementStore(str(tmp_path / "missing.db"), read_only=True)
+    assert not (tmp_path / "missing.db").exists()
+
+    connection = sqlite3.connect(str(tmp_path / "statements.db"))
+    connection.execute("CREATE TABLE statements (parser TEXT)")
+    connection.execute("PRAGMA user_version = 0")
+    connection.commit()
+    connection.close()
+
+    # A database of another schema version is reported instead of being re-initialized
+    with pytest.raises(SystemExit):
+        StatementStore(str(tmp_path / "statements.db"), read_only=True)
+
+    connection = sqlite3.connect(str(tmp_path / "statements.db"))
+    assert connection.execute("SELECT sql FROM sqlite_master WHERE name = 'statements'").fetchone()[0] == "CREATE TABLE statements (parser TEXT)"
+    connection.close()